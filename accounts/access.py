@@ -0,0 +1,91 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import CaseMembership
+
+# Rôles ayant accès à tous les dossiers, sans lien explicite
+GLOBAL_VIEWER_ROLES = ('lawyer', 'judge', 'administrator')
+
+
+def case_access_cache_key(user_id, case_id):
+    return f'case_access:{user_id}:{case_id}'
+
+
+def invalidate_case_access(pairs):
+    """Oublie les rôles en cache pour les couples (user_id, case_id) donnés, une fois la transaction validée."""
+    if getattr(settings, 'CASE_ACCESS_CACHE_TIMEOUT', 0):
+        keys = [case_access_cache_key(user_id, case_id) for user_id, case_id in pairs]
+        # Avant le commit, une requête concurrente remettrait en cache les rôles d'avant le changement
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class CaseAccess:
+    """
+    Rôles de l'utilisateur courant sur les dossiers, chargés une seule fois par requête.
+
+    Si CASE_ACCESS_CACHE_TIMEOUT est défini, les rôles sont aussi gardés dans le cache
+    Django entre les requêtes ; accounts.signals les invalide quand les liaisons changent.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._roles = {}
+
+    def roles(self, case):
+        case_id = getattr(case, 'pk', case)
+        if case_id not in self._roles:
+            self._roles[case_id] = self._load_roles(case_id)
+        return self._roles[case_id]
+
+    def _load_roles(self, case_id):
+        if not self.user.is_authenticated:
+            return frozenset()
+
+        timeout = getattr(settings, 'CASE_ACCESS_CACHE_TIMEOUT', 0)
+        key = case_access_cache_key(self.user.pk, case_id)
+        if timeout:
+            roles = cache.get(key)
+            if roles is not None:
+                return roles
+
+        roles = frozenset(CaseMembership.objects.filter(user=self.user, case_id=case_id).values_list('role', flat=True))
+        if timeout:
+            cache.set(key, roles, timeout)
+        return roles
+
+    def is_member(self, case):
+        return bool(self.roles(case))
+
+    def is_parent(self, case):
+        return 'parent' in self.roles(case)
+
+    def can_view(self, case):
+        return self.user.is_authenticated and (self.user.role in GLOBAL_VIEWER_ROLES or self.is_member(case))
+
+
+def get_case_access(request):
+    access = getattr(request, 'case_access', None)
+    if access is None:
+        access = request.case_access = CaseAccess(request.user)
+    return access
@@ -18,9 +18,15 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+from django import forms
 from django.contrib import admin
+from django.contrib.admin import helpers
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.template.response import TemplateResponse
+
+from .memberships import MEMBERSHIP_SOURCES, reassign_links
+from .models import AvocatCase, JugeCase, User as AccountUser
 
 
 
@@ -48,5 +54,55 @@ class MagistrateParentAdmin(admin.ModelAdmin):
     search_fields = ('magistrate__email', 'parent__email')
 
 
+class ReassignForm(forms.Form):
+    target = forms.ModelChoiceField(queryset=AccountUser.objects.none(), label='Reassign to')
+
+    def __init__(self, role, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['target'].queryset = AccountUser.objects.filter(role=role).order_by('last_name', 'email')
+
+
+@admin.action(description='Reassign the selected cases to another user')
+def reassign_selected(modeladmin, request, queryset):
+    # Page intermédiaire : choix du nouvel utilisateur, puis un seul UPDATE pour toute la sélection
+    role = MEMBERSHIP_SOURCES[modeladmin.model][1]
+    form = ReassignForm(role, request.POST if 'apply' in request.POST else None)
+    if form.is_valid():
+        target = form.cleaned_data['target']
+        result = reassign_links(modeladmin.model, queryset, target.pk)
+        modeladmin.message_user(
+            request,
+            f"{result['cases']} cases reassigned to {target.email} "
+            f"({result['moved']} moved, {result['merged']} already assigned to the target).",
+        )
+        return None
+    return TemplateResponse(request, 'admin/accounts/reassign_caseload.html', {
+        **modeladmin.admin_site.each_context(request),
+        'title': 'Reassign cases',
+        'opts': modeladmin.model._meta,
+        'form': form,
+        'queryset': queryset,
+        'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+    })
+
+
+@admin.register(AvocatCase)
+class AvocatCaseAdmin(admin.ModelAdmin):
+    list_display = ('avocat', 'case')
+    list_filter = ('avocat',)
+    search_fields = ('avocat__email', 'avocat__last_name')
+    list_select_related = ('avocat', 'case')
+    actions = [reassign_selected]
+
+
+@admin.register(JugeCase)
+class JugeCaseAdmin(admin.ModelAdmin):
+    list_display = ('juge', 'case')
+    list_filter = ('juge',)
+    search_fields = ('juge__email', 'juge__last_name')
+    list_select_related = ('juge', 'case')
+    actions = [reassign_selected]
+
+
 admin.site.register(User, UserAdmin)
 # admin.site.register(MagistrateParent, MagistrateParentAdmin)
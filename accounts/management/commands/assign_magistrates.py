@@ -0,0 +1,66 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.memberships import assign_magistrates
+from accounts.models import User
+from payments.models import Case
+
+
+#  $ python manage.py assign_magistrates --case <uuid> [--case <uuid> ...] [--judge juge@example.com ...] [--lawyer avocat@example.com ...]
+#  $ python manage.py assign_magistrates --all-cases-of avocat@example.com --judge juge@example.com
+class Command(BaseCommand):
+    help = 'Assigns a set of judges and lawyers to a set of cases in a single transaction.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--case', action='append', dest='cases', default=[], help='Case id (repeatable).')
+        parser.add_argument('--all-cases-of', help='Also select every case the given lawyer or judge is assigned to.')
+        parser.add_argument('--judge', action='append', dest='judges', default=[], help='Judge e-mail (repeatable).')
+        parser.add_argument('--lawyer', action='append', dest='lawyers', default=[], help='Lawyer e-mail (repeatable).')
+
+    def handle(self, *args, **options):
+        try:
+            case_ids = set(Case.objects.filter(pk__in=options['cases']).values_list('id', flat=True))
+        except ValidationError:
+            raise CommandError('Invalid case id.')
+        if len(case_ids) != len(set(options['cases'])):
+            raise CommandError('Unknown case id.')
+        if options['all_cases_of']:
+            case_ids.update(Case.objects.filter(
+                memberships__user__email=options['all_cases_of'], memberships__role__in=['lawyer', 'judge'],
+            ).values_list('id', flat=True))
+        if not case_ids:
+            raise CommandError('No case selected.')
+
+        judge_ids = self.get_user_ids(options['judges'], 'judge')
+        lawyer_ids = self.get_user_ids(options['lawyers'], 'lawyer')
+        created = assign_magistrates(case_ids, judge_ids, lawyer_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f"SUCCES: {created['judges']} judge and {created['lawyers']} lawyer assignments created on {len(case_ids)} cases."
+        ))
+
+    def get_user_ids(self, emails, role):
+        users = dict(User.objects.filter(email__in=emails, role=role).values_list('email', 'id'))
+        missing = set(emails) - set(users)
+        if missing:
+            raise CommandError(f"Unknown {role}(s): {', '.join(sorted(missing))}.")
+        return list(users.values())
@@ -0,0 +1,59 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.memberships import reassign_caseload
+from accounts.models import AvocatCase, JugeCase, User
+
+LINK_MODELS = {
+    'lawyer': AvocatCase,
+    'judge': JugeCase,
+}
+
+
+#  $ python manage.py reassign_caseload --from ancien.avocat@example.com --to nouvel.avocat@example.com
+#  $ python manage.py reassign_caseload --role judge --from ancien.juge@example.com --to nouveau.juge@example.com
+class Command(BaseCommand):
+    help = "Moves every case of a departing lawyer (or judge) to another one in a single transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='from_user', required=True, help='E-mail of the departing user.')
+        parser.add_argument('--to', dest='to_user', required=True, help='E-mail of the user taking over the cases.')
+        parser.add_argument('--role', choices=sorted(LINK_MODELS), default='lawyer')
+
+    def handle(self, *args, **options):
+        role = options['role']
+        from_user = self.get_user(options['from_user'], role)
+        to_user = self.get_user(options['to_user'], role)
+        if from_user.pk == to_user.pk:
+            raise CommandError('The source and target users are the same.')
+
+        result = reassign_caseload(LINK_MODELS[role], from_user.pk, to_user.pk)
+        self.stdout.write(self.style.SUCCESS(
+            f"SUCCES: {result['cases']} cases reassigned from {from_user.email} to {to_user.email} "
+            f"({result['moved']} moved, {result['merged']} already assigned to the target)."
+        ))
+
+    def get_user(self, email, role):
+        try:
+            return User.objects.get(email=email, role=role)
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown {role}: {email}.")
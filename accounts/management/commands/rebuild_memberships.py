@@ -0,0 +1,32 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from django.core.management.base import BaseCommand
+
+from accounts.memberships import rebuild_memberships
+
+
+#  $ python manage.py rebuild_memberships
+class Command(BaseCommand):
+    help = 'Rebuilds the case membership index from the parent, lawyer and judge case links.'
+
+    def handle(self, *args, **kwargs):
+        count = rebuild_memberships()
+        self.stdout.write(self.style.SUCCESS(f'SUCCES: {count} case memberships rebuilt.'))
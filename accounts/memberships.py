@@ -0,0 +1,140 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from django.db import transaction
+
+from .access import invalidate_case_access
+from .models import AvocatCase, JugeCase, ParentCase, CaseMembership
+
+# Modèle de liaison -> (champ utilisateur, rôle dans CaseMembership)
+MEMBERSHIP_SOURCES = {
+    ParentCase: ('parent', 'parent'),
+    AvocatCase: ('avocat', 'lawyer'),
+    JugeCase: ('juge', 'judge'),
+}
+
+
+@transaction.atomic
+def sync_case_memberships(link_model, case_ids=None):
+    """Recopie dans CaseMembership les liaisons de `link_model`, pour tous les dossiers ou ceux de `case_ids`."""
+    user_field, role = MEMBERSHIP_SOURCES[link_model]
+    links = link_model.objects.all()
+    memberships = CaseMembership.objects.filter(role=role)
+    if case_ids is not None:
+        links = links.filter(case_id__in=case_ids)
+        memberships = memberships.filter(case_id__in=case_ids)
+
+    previous = set(memberships.values_list('user_id', 'case_id'))
+    memberships.delete()
+    created = CaseMembership.objects.bulk_create([
+        CaseMembership(case_id=case_id, user_id=user_id, role=role)
+        for case_id, user_id in links.values_list('case_id', f'{user_field}_id').iterator()
+    ], batch_size=1000, ignore_conflicts=True)
+    invalidate_case_access(previous | {(membership.user_id, membership.case_id) for membership in created})
+    return len(created)
+
+
+def rebuild_memberships():
+    return sum(sync_case_memberships(link_model) for link_model in MEMBERSHIP_SOURCES)
+
+
+@transaction.atomic
+def assign_to_cases(link_model, user_ids, case_ids):
+    """
+    Lie chaque utilisateur de `user_ids` à chaque dossier de `case_ids` (JugeCase ou AvocatCase) ;
+    les liaisons déjà présentes sont ignorées. Retourne le nombre de liaisons créées.
+    """
+    user_field, role = MEMBERSHIP_SOURCES[link_model]
+    pairs = [(user_id, case_id) for user_id in set(user_ids) for case_id in set(case_ids)]
+    if not pairs:
+        return 0
+    links = link_model.objects.filter(case_id__in=case_ids, **{f'{user_field}_id__in': user_ids})
+    before = links.count()
+
+    link_model.objects.bulk_create([
+        link_model(case_id=case_id, **{f'{user_field}_id': user_id}) for user_id, case_id in pairs
+    ], batch_size=1000, ignore_conflicts=True)
+    # bulk_create n'envoie pas post_save : CaseMembership est complété ici
+    CaseMembership.objects.bulk_create([
+        CaseMembership(case_id=case_id, user_id=user_id, role=role) for user_id, case_id in pairs
+    ], batch_size=1000, ignore_conflicts=True)
+    invalidate_case_access(pairs)
+    return links.count() - before
+
+
+@transaction.atomic
+def unassign_from_cases(link_model, user_ids, case_ids):
+    """
+    Supprime les liaisons entre `user_ids` et `case_ids` en deux DELETE filtrés : un sur CaseMembership,
+    un sur les liaisons. Les receveurs post_delete empêcheraient la suppression rapide de Django, qui
+    chargerait alors chaque liaison pour lui envoyer le signal : ils sont contournés et leur travail fait ici.
+    """
+    user_field, role = MEMBERSHIP_SOURCES[link_model]
+    CaseMembership.objects.filter(case_id__in=case_ids, user_id__in=user_ids, role=role).delete()
+    links = link_model.objects.filter(**{'case_id__in': case_ids, f'{user_field}_id__in': user_ids})
+    deleted = links._raw_delete(links.db)
+    invalidate_case_access([(user_id, case_id) for user_id in set(user_ids) for case_id in set(case_ids)])
+    return deleted
+
+
+@transaction.atomic
+def assign_magistrates(case_ids, judge_ids=(), lawyer_ids=()):
+    """Lie un ensemble de juges et d'avocats à un ensemble de dossiers, en une seule transaction."""
+    return {
+        'judges': assign_to_cases(JugeCase, judge_ids, case_ids),
+        'lawyers': assign_to_cases(AvocatCase, lawyer_ids, case_ids),
+    }
+
+
+@transaction.atomic
+def reassign_links(link_model, links, to_user_id):
+    """
+    Transfère à `to_user_id` les liaisons `links` (JugeCase ou AvocatCase) par un UPDATE unique.
+    Quand la cible est déjà liée au dossier, la liaison d'origine est supprimée plutôt que
+    déplacée, pour respecter unique_together. Retourne les nombres de dossiers touchés,
+    de liaisons déplacées et de liaisons fusionnées.
+    """
+    user_field, role = MEMBERSHIP_SOURCES[link_model]
+    rows = list(links.select_for_update().values_list('pk', 'case_id', f'{user_field}_id'))
+    case_ids = {case_id for pk, case_id, user_id in rows}
+
+    assigned = set(link_model.objects.filter(
+        case_id__in=case_ids, **{f'{user_field}_id': to_user_id}
+    ).values_list('case_id', flat=True))
+    moved_ids, merged_ids = [], []
+    for pk, case_id, user_id in rows:
+        if user_id == to_user_id:
+            continue
+        if case_id in assigned:
+            merged_ids.append(pk)
+        else:
+            assigned.add(case_id)
+            moved_ids.append(pk)
+
+    link_model.objects.filter(pk__in=merged_ids).delete()
+    moved = link_model.objects.filter(pk__in=moved_ids).update(**{f'{user_field}_id': to_user_id})
+    # update() n'envoie pas de signaux : l'index des membres est resynchronisé pour ces dossiers
+    sync_case_memberships(link_model, case_ids)
+    return {'cases': len(case_ids), 'moved': moved, 'merged': len(merged_ids)}
+
+
+def reassign_caseload(link_model, from_user_id, to_user_id):
+    user_field, role = MEMBERSHIP_SOURCES[link_model]
+    return reassign_links(link_model, link_model.objects.filter(**{f'{user_field}_id': from_user_id}), to_user_id)
@@ -141,3 +141,23 @@ class ParentCase(models.Model):
 
     def __str__(self):
         return f"{self.parent} - {self.case} ({self.percentage}%)"
+
+
+class CaseMembership(models.Model):
+    # Copie dénormalisée de ParentCase, AvocatCase et JugeCase, maintenue par accounts.signals
+    ROLE_CHOICES = [
+        ('parent', 'Parent'),
+        ('lawyer', 'Attorney'),
+        ('judge', 'Judge'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    case = models.ForeignKey(get_case_model(), on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='case_memberships')
+    role = models.CharField(max_length=13, choices=ROLE_CHOICES)
+
+    class Meta:
+        # L'index unique commence par (user, case) : il sert aussi aux contrôles d'accès
+        unique_together = (('user', 'case', 'role'),)
+
+    def __str__(self):
+        return f"{self.user} - {self.case_id} ({self.role})"
@@ -0,0 +1,52 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .access import invalidate_case_access
+from .memberships import MEMBERSHIP_SOURCES, sync_case_memberships
+from .models import AvocatCase, JugeCase, ParentCase, CaseMembership
+
+
+@receiver(post_save, sender=ParentCase)
+@receiver(post_save, sender=AvocatCase)
+@receiver(post_save, sender=JugeCase)
+def add_case_membership(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    user_field, role = MEMBERSHIP_SOURCES[sender]
+    if created:
+        user_id = getattr(instance, f'{user_field}_id')
+        CaseMembership.objects.get_or_create(case_id=instance.case_id, user_id=user_id, role=role)
+        invalidate_case_access([(user_id, instance.case_id)])
+    else:
+        # L'utilisateur lié a pu changer : on resynchronise ce dossier pour ce rôle
+        sync_case_memberships(sender, [instance.case_id])
+
+
+@receiver(post_delete, sender=ParentCase)
+@receiver(post_delete, sender=AvocatCase)
+@receiver(post_delete, sender=JugeCase)
+def remove_case_membership(sender, instance, **kwargs):
+    user_field, role = MEMBERSHIP_SOURCES[sender]
+    user_id = getattr(instance, f'{user_field}_id')
+    CaseMembership.objects.filter(case_id=instance.case_id, user_id=user_id, role=role).delete()
+    invalidate_case_access([(user_id, instance.case_id)])
@@ -5,7 +5,9 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.exceptions import ValidationError
 from PIL import Image
 
-from accounts.models import User, AvocatCase, JugeCase
+from accounts.access import CaseAccess
+from accounts.memberships import assign_magistrates, reassign_caseload, unassign_from_cases
+from accounts.models import User, AvocatCase, CaseMembership, JugeCase, ParentCase
 from accounts.validations import validate_image, clean_email, sanitize_text, validate_national_number, validate_password, validate_telephone
 from payments.models import Case
 from django.utils import timezone
@@ -161,3 +163,79 @@ class JugeCaseModelTestCase(TestCase):
         juge_case = JugeCase.objects.create(juge=self.user, case=self.case)
         self.assertEqual(juge_case.juge.email, 'judge@example.com')
         self.assertEqual(juge_case.case, self.case)
+
+
+class CaseMembershipTestCase(TestCase):
+
+    def setUp(self):
+        self.lawyer = User.objects.create_user(email='member-lawyer@example.com', password='ComplexPassword1!', role='lawyer')
+        self.parent = User.objects.create_user(email='member-parent@example.com', password='ComplexPassword1!', role='parent')
+        self.case = Case.objects.create(draft=False)
+
+    def test_membership_follows_links(self):
+        avocat_case = AvocatCase.objects.create(avocat=self.lawyer, case=self.case)
+        ParentCase.objects.create(parent=self.parent, case=self.case)
+        self.assertEqual(
+            set(CaseMembership.objects.filter(case=self.case).values_list('user_id', 'role')),
+            {(self.lawyer.id, 'lawyer'), (self.parent.id, 'parent')}
+        )
+
+        avocat_case.delete()
+        self.assertFalse(CaseMembership.objects.filter(user=self.lawyer, case=self.case).exists())
+
+
+class CaseAccessTestCase(TestCase):
+
+    def setUp(self):
+        self.parent = User.objects.create_user(email='access-parent@example.com', password='ComplexPassword1!', role='parent')
+        self.other = User.objects.create_user(email='access-other@example.com', password='ComplexPassword1!', role='parent')
+        self.case = Case.objects.create(draft=False)
+        ParentCase.objects.create(parent=self.parent, case=self.case)
+
+    def test_roles_are_loaded_once_per_resolver(self):
+        access = CaseAccess(self.parent)
+        with self.assertNumQueries(1):
+            self.assertTrue(access.can_view(self.case))
+            self.assertTrue(access.is_parent(self.case))
+            self.assertTrue(access.is_member(self.case.pk))
+        self.assertFalse(CaseAccess(self.other).can_view(self.case))
+
+
+class BulkAssignmentTestCase(TestCase):
+
+    def setUp(self):
+        self.judge = User.objects.create_user(email='bulk-judge@example.com', password='ComplexPassword1!', role='judge')
+        self.lawyer = User.objects.create_user(email='bulk-lawyer@example.com', password='ComplexPassword1!', role='lawyer')
+        self.cases = [Case.objects.create(draft=False) for _ in range(3)]
+        JugeCase.objects.create(juge=self.judge, case=self.cases[0])
+
+    def test_assignment_skips_existing_links_and_indexes_memberships(self):
+        case_ids = [case.pk for case in self.cases]
+        created = assign_magistrates(case_ids, [self.judge.pk], [self.lawyer.pk])
+        self.assertEqual(created, {'judges': 2, 'lawyers': 3})
+        self.assertEqual(CaseMembership.objects.filter(user=self.judge, role='judge').count(), 3)
+        self.assertEqual(CaseMembership.objects.filter(user=self.lawyer, role='lawyer').count(), 3)
+
+    def test_unassignment_removes_links_and_memberships(self):
+        unassign_from_cases(JugeCase, [self.judge.pk], [self.cases[0].pk])
+        self.assertFalse(JugeCase.objects.filter(juge=self.judge).exists())
+        self.assertFalse(CaseMembership.objects.filter(user=self.judge).exists())
+
+
+class CaseloadReassignmentTestCase(TestCase):
+
+    def setUp(self):
+        self.departing = User.objects.create_user(email='departing@example.com', password='ComplexPassword1!', role='lawyer')
+        self.successor = User.objects.create_user(email='successor@example.com', password='ComplexPassword1!', role='lawyer')
+        self.cases = [Case.objects.create(draft=False) for _ in range(3)]
+        for case in self.cases:
+            AvocatCase.objects.create(avocat=self.departing, case=case)
+        AvocatCase.objects.create(avocat=self.successor, case=self.cases[0])
+
+    def test_reassignment_merges_existing_links(self):
+        result = reassign_caseload(AvocatCase, self.departing.pk, self.successor.pk)
+        self.assertEqual(result, {'cases': 3, 'moved': 2, 'merged': 1})
+        self.assertFalse(AvocatCase.objects.filter(avocat=self.departing).exists())
+        self.assertEqual(AvocatCase.objects.filter(avocat=self.successor).count(), 3)
+        self.assertFalse(CaseMembership.objects.filter(user=self.departing).exists())
+        self.assertEqual(CaseMembership.objects.filter(user=self.successor, role='lawyer').count(), 3)
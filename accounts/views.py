@@ -34,9 +34,8 @@ from django.utils.translation import gettext as _
 from django.views.generic import ListView, UpdateView
 from pip._internal.utils import logging
 
-from payments.models import Case
 from .forms import JusticeRegistrationForm, UserRegisterForm, UserUpdateForm, CancelDeletionForm, DeletionRequestForm
-from .models import User, AvocatCase, JugeCase
+from .models import User, AvocatCase, JugeCase, CaseMembership
 
 User = get_user_model()
 
@@ -79,14 +78,16 @@ class UserUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         return False
 
     def _user_assigned_to_case(self, user):
-        if self.request.user.role == 'lawyer':
-            return AvocatCase.objects.filter(avocat=self.request.user, case__in=self._parent_cases(user)).exists()
-        elif self.request.user.role == 'judge':
-            return JugeCase.objects.filter(juge=self.request.user, case__in=self._parent_cases(user)).exists()
+        if self.request.user.role in ['lawyer', 'judge']:
+            return CaseMembership.objects.filter(user=self.request.user, role=self.request.user.role, case__in=self._parent_cases(user)).exists()
         return False
 
     def _parent_cases(self, user):
-        return Case.objects.filter(parent1=user) | Case.objects.filter(parent2=user)
+        return CaseMembership.objects.filter(user=user, role='parent').values('case_id')
+
+    def _parent_ids_of_cases(self, user):
+        cases = CaseMembership.objects.filter(user=user, role=user.role).values('case_id')
+        return set(CaseMembership.objects.filter(role='parent', case__in=cases).values_list('user_id', flat=True))
 
     def _handle_related_users(self, related_users):
         related_users_ids = set(related_users.values_list('id', flat=True))
@@ -104,14 +105,11 @@ class UserUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         self._update_relationships(related_users_ids, current_judge_relations, JugeCase, 'juge')
 
     def _handle_lawyer_judge_relationships(self, related_users_ids):
+        current_relations = self._parent_ids_of_cases(self.object)
         if self.object.role == 'lawyer':
-            current_relations = set(AvocatCase.objects.filter(avocat=self.object).values_list('case__parent1_id', flat=True)) | \
-                                set(AvocatCase.objects.filter(avocat=self.object).values_list('case__parent2_id', flat=True))
             relationship_model = AvocatCase
             own_field = 'avocat'
         elif self.object.role == 'judge':
-            current_relations = set(JugeCase.objects.filter(juge=self.object).values_list('case__parent1_id', flat=True)) | \
-                                set(JugeCase.objects.filter(juge=self.object).values_list('case__parent2_id', flat=True))
             relationship_model = JugeCase
             own_field = 'juge'
 
@@ -121,14 +119,12 @@ class UserUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         relationships_to_add = related_users_ids - current_relations
         relationships_to_remove = current_relations - related_users_ids
 
-        relationship_model.objects.filter(**{own_field: self.object, 'case__parent1_id__in': relationships_to_remove}).delete()
-        relationship_model.objects.filter(**{own_field: self.object, 'case__parent2_id__in': relationships_to_remove}).delete()
+        removed_cases = CaseMembership.objects.filter(role='parent', user_id__in=relationships_to_remove).values('case_id')
+        relationship_model.objects.filter(**{own_field: self.object, 'case__in': removed_cases}).delete()
 
-        for user_id in relationships_to_add:
-            parent_instance = User.objects.get(pk=user_id)
-            if parent_instance.role == 'parent':
-                relationship_model.objects.get_or_create(**{own_field: self.object, 'case__parent1': parent_instance})
-                relationship_model.objects.get_or_create(**{own_field: self.object, 'case__parent2': parent_instance})
+        added_cases = CaseMembership.objects.filter(role='parent', user_id__in=relationships_to_add).values_list('case_id', flat=True)
+        for case_id in added_cases:
+            relationship_model.objects.get_or_create(**{own_field: self.object, 'case_id': case_id})
 
     def post(self, request, *args, **kwargs):
         if 'deassign' in request.POST:
@@ -138,11 +134,9 @@ class UserUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     def deassign_user(self):
         user_to_update = self.get_object()
         if self.request.user.role == 'lawyer':
-            relationships = AvocatCase.objects.filter(avocat=self.request.user, case__parent1=user_to_update) | \
-                            AvocatCase.objects.filter(avocat=self.request.user, case__parent2=user_to_update)
+            relationships = AvocatCase.objects.filter(avocat=self.request.user, case__in=self._parent_cases(user_to_update))
         elif self.request.user.role == 'judge':
-            relationships = JugeCase.objects.filter(juge=self.request.user, case__parent1=user_to_update) | \
-                            JugeCase.objects.filter(juge=self.request.user, case__parent2=user_to_update)
+            relationships = JugeCase.objects.filter(juge=self.request.user, case__in=self._parent_cases(user_to_update))
         else:
             messages.error(self.request, _("You are not authorized to deassign this user."))
             return redirect('accounts:user_update', pk=user_to_update.pk)
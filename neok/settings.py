@@ -86,6 +86,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.middleware.CaseAccessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -172,8 +173,36 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Relevés PDF rendus en arrière-plan (hors MEDIA_ROOT : ils ne doivent pas être servis publiquement)
+STATEMENT_ROOT = os.path.join(BASE_DIR, 'statements')
+
+# Processus de rendu des relevés, par processus du serveur web
+STATEMENT_WORKERS = env('STATEMENT_WORKERS', cast=int, default=2)
+
+# Justificatifs enregistrés en parallèle lors d'un envoi de plusieurs paiements
+PAYMENT_UPLOAD_WORKERS = env('PAYMENT_UPLOAD_WORKERS', cast=int, default=4)
+
+# Moteur de rendu des relevés : 'xhtml2pdf' (gabarit HTML) ou 'reportlab' (tableaux platypus, plus rapide)
+STATEMENT_RENDERER = env('STATEMENT_RENDERER', default='xhtml2pdf')
+
+# Nombre de lignes lues par paquet par le curseur serveur lors des exports CSV/XLSX
+EXPORT_CHUNK_SIZE = env('EXPORT_CHUNK_SIZE', cast=int, default=2000)
+
+# Âge (anniversaire) à partir duquel un enfant n'est plus compté dans la contribution accumulée
+CONTRIBUTION_UNTIL_AGE = env('CONTRIBUTION_UNTIL_AGE', cast=int, default=18)
+
+# Scénarios d'indexation annuelle (%) et horizon (années) proposés par défaut par la projection des contributions
+PROJECTION_DEFAULT_RATES = env.list('PROJECTION_DEFAULT_RATES', cast=float, default=[0.0, 1.0, 2.0, 3.0])
+PROJECTION_DEFAULT_YEARS = env('PROJECTION_DEFAULT_YEARS', cast=int, default=5)
+
 ANONYMOUS_USER_NAME = None
 
+# Durée (secondes) de mise en cache des rôles d'un utilisateur sur un dossier, 0 pour désactiver
+CASE_ACCESS_CACHE_TIMEOUT = env('CASE_ACCESS_CACHE_TIMEOUT', cast=int, default=0)
+
+# Intervalle (secondes) entre deux vérifications du numéro de version des caches en mémoire (catalogue des catégories)
+CACHE_VERSION_CHECK_INTERVAL = env('CACHE_VERSION_CHECK_INTERVAL', cast=float, default=5)
+
 COOKIEBANNER = {
     "title": _("Cookie settings"),
     "header_text": _("We are using a few essential cookies on this website."),
@@ -0,0 +1,116 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import functools
+from datetime import date
+
+import numpy as np
+from django.conf import settings
+
+from accounts.models import ParentCase
+from .balance import BASIS_POINTS, from_cents, round_half_up_div, to_basis_points, to_cents
+from .indexation import index_table
+from .models import Child
+from .periods import period_range
+
+ACCRUAL_CACHE_SIZE = 4096
+
+
+def month_range(start, end):
+    """Mois [start, end[ sous forme de tableau datetime64[M]."""
+    return np.arange(np.datetime64(start, 'M'), np.datetime64(end, 'M'))
+
+
+def accrue(months, birth_dates, index_years, index_cents, until_age=None):
+    """
+    Contribution due (cents) pour chaque mois de `months` : le montant de l'indexation en vigueur
+    l'année du mois, multiplié par le nombre d'enfants nés au plus tard ce mois-là et, si `until_age`
+    est donné, qui n'ont pas encore atteint cet âge (mois de l'anniversaire exclu, comme la projection).
+    """
+    births = np.array(birth_dates, dtype='datetime64[M]')
+    in_charge = births[np.newaxis, :] <= months[:, np.newaxis]
+    if until_age is not None:
+        in_charge &= months[:, np.newaxis] < births[np.newaxis, :] + np.timedelta64(until_age * 12, 'M')
+    children = in_charge.sum(axis=1)
+    if not len(index_years):
+        return np.zeros(len(months), dtype=np.int64)
+
+    years = months.astype('datetime64[Y]').astype(np.int64) + 1970
+    position = np.searchsorted(np.asarray(index_years), years, side='right') - 1
+    amounts = np.where(position >= 0, np.asarray(index_cents, dtype=np.int64)[np.clip(position, 0, None)], 0)
+    return amounts * children
+
+
+def accrual_bounds(birth_dates, first_index_year, year, quarter, until):
+    # Sans période, l'accumulation commence au premier mois où un enfant est né et une indexation existe
+    if year is not None:
+        start, end = period_range(year, quarter)
+    elif birth_dates and first_index_year is not None:
+        start, end = max(min(birth_dates), date(first_index_year, 1, 1)), until
+    else:
+        return None
+    end = min(end, until)
+    return (start, end) if start < end else None
+
+
+@functools.lru_cache(maxsize=ACCRUAL_CACHE_SIZE)
+def _case_accrual(case_id, ledger_version, index_version, year, quarter, until, until_age):
+    # ledger_version et index_version ne servent qu'à la clé : un enfant, un pourcentage ou une indexation
+    # modifiés changent la clé, et l'ancienne entrée finit par sortir du cache
+    birth_dates = list(Child.objects.filter(case_id=case_id).values_list('birth_date', flat=True))
+    percentages = list(ParentCase.objects.filter(case_id=case_id).order_by('id').values_list('percentage', flat=True)[:2])
+    percentages += [0] * (2 - len(percentages))
+    by_year = index_table.get()['by_year']
+    index_years = sorted(by_year)
+
+    bounds = accrual_bounds(birth_dates, index_years[0] if index_years else None, year, quarter, until)
+    if bounds is None:
+        monthly = np.zeros(0, dtype=np.int64)
+    else:
+        monthly = accrue(
+            month_range(*bounds), birth_dates, index_years, [to_cents(by_year[y].amount) for y in index_years], until_age,
+        )
+
+    total = int(monthly.sum())
+    parent1_basis_points, parent2_basis_points = (to_basis_points(percentage) for percentage in percentages)
+    parent1 = int(round_half_up_div(total * parent1_basis_points, BASIS_POINTS))
+    # Même règle que balance.settle : si les parts font 100 %, la seconde est le complément
+    if parent1_basis_points + parent2_basis_points == BASIS_POINTS:
+        parent2 = total - parent1
+    else:
+        parent2 = int(round_half_up_div(total * parent2_basis_points, BASIS_POINTS))
+    return {
+        'accrued_months': len(monthly),
+        'accrued_total': from_cents(total),
+        'parent1_accrued': from_cents(parent1),
+        'parent2_accrued': from_cents(parent2),
+    }
+
+
+def get_case_accrual(case, year=None, quarter=None, today=None):
+    """
+    Contribution alimentaire accumulée du dossier pour l'année ou le trimestre (tout l'historique
+    si `year` est None), jusqu'au mois en cours inclus, et part de chaque parent.
+    """
+    today = today or date.today()
+    until = date(today.year + 1, 1, 1) if today.month == 12 else date(today.year, today.month + 1, 1)
+    return dict(_case_accrual(
+        case.pk, case.ledger_version, index_table.get_version(), year, quarter, until, settings.CONTRIBUTION_UNTIL_AGE,
+    ))
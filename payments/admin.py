@@ -0,0 +1,59 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import time
+
+from django.contrib import admin
+
+from .balance import compute_case_balances, from_cents
+from .models import Case, ClosedPeriod
+from .summaries import rebuild_case_balances
+
+
+@admin.register(Case)
+class CaseAdmin(admin.ModelAdmin):
+    list_display = ('id', 'display_name', 'draft', 'created_at', 'updated_at')
+    list_filter = ('draft',)
+    search_fields = ('search_name',)
+    actions = ['recompute_balances']
+
+    @admin.action(description='Recompute balances')
+    def recompute_balances(self, request, queryset):
+        started = time.monotonic()
+        case_ids = list(queryset.values_list('id', flat=True))
+        rebuild_case_balances(case_ids)
+        balances = compute_case_balances(case_ids)
+
+        unbalanced = int((balances['net'] != 0).sum())
+        outstanding = from_cents(abs(balances['net']).sum())
+        self.message_user(
+            request,
+            f"{len(balances['case_ids'])} cases recomputed in {time.monotonic() - started:.1f}s: "
+            f"{unbalanced} unbalanced, {outstanding} € outstanding in total."
+        )
+
+
+@admin.register(ClosedPeriod)
+class ClosedPeriodAdmin(admin.ModelAdmin):
+    # Supprimer une clôture rouvre le trimestre : les vues relisent alors CaseBalanceSummary
+    list_display = ('case', 'year', 'quarter', 'closed_by', 'closed_at')
+    list_filter = ('year', 'quarter')
+    list_select_related = ('case', 'closed_by')
+    readonly_fields = ('case', 'year', 'quarter', 'snapshot', 'closed_by', 'closed_at')
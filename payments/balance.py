@@ -0,0 +1,145 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+
+from accounts.models import ParentCase
+from .models import Document
+from .periods import period_filter
+
+# Tous les montants sont des entiers en cents et les pourcentages en points de base (1 % = 100) :
+# les calculs vectorisés restent exacts, l'arrondi n'a lieu qu'une fois, au cent, moitié vers le haut.
+BASIS_POINTS = 10000
+
+
+def to_cents(amount):
+    return int((Decimal(amount) * 100).to_integral_value(ROUND_HALF_UP))
+
+
+def to_basis_points(percentage):
+    return int((Decimal(str(percentage)) * 100).to_integral_value(ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return (Decimal(int(cents)) / 100).quantize(Decimal('0.01'))
+
+
+def round_half_up_div(numerator, denominator):
+    numerator = np.asarray(numerator, dtype=np.int64)
+    return np.sign(numerator) * ((np.abs(numerator) + denominator // 2) // denominator)
+
+
+def settle(parent1_cents, parent2_cents, parent1_basis_points, parent2_basis_points):
+    """
+    Part due par chaque parent et solde net, pour des tableaux de dossiers.
+
+    `net` > 0 : le parent 1 a avancé plus que sa part, le parent 2 lui doit `net` ;
+    `net` < 0 : l'inverse.
+    """
+    parent1_cents = np.asarray(parent1_cents, dtype=np.int64)
+    parent2_cents = np.asarray(parent2_cents, dtype=np.int64)
+    parent1_basis_points = np.asarray(parent1_basis_points, dtype=np.int64)
+    parent2_basis_points = np.asarray(parent2_basis_points, dtype=np.int64)
+
+    total = parent1_cents + parent2_cents
+    parent1_due = round_half_up_div(total * parent1_basis_points, BASIS_POINTS)
+    # Si les parts font 100 %, la seconde est le complément : la somme des parts reste égale au total
+    parent2_due = np.where(
+        parent1_basis_points + parent2_basis_points == BASIS_POINTS,
+        total - parent1_due,
+        round_half_up_div(total * parent2_basis_points, BASIS_POINTS),
+    )
+    net = round_half_up_div((parent1_cents - parent1_due) - (parent2_cents - parent2_due), 2)
+    return {
+        'total': total,
+        'parent1_due': parent1_due,
+        'parent2_due': parent2_due,
+        'net': net,
+    }
+
+
+def settle_case(parent1_total, parent2_total, parent1_percentage, parent2_percentage):
+    # Version d'un seul dossier, pour l'historique des paiements et le relevé PDF
+    result = settle(
+        [to_cents(parent1_total)], [to_cents(parent2_total)],
+        [to_basis_points(parent1_percentage)], [to_basis_points(parent2_percentage)],
+    )
+    return {
+        'parent1_due': from_cents(result['parent1_due'][0]),
+        'parent2_due': from_cents(result['parent2_due'][0]),
+        'net': from_cents(result['net'][0]),
+    }
+
+
+def load_parent_shares(case_ids=None):
+    """Identifiants des dossiers, pourcentages (points de base) et rang (0/1) de chaque parent."""
+    parent_cases = ParentCase.objects.order_by('case_id', 'id')
+    if case_ids is not None:
+        parent_cases = parent_cases.filter(case_id__in=case_ids)
+
+    case_index = {}
+    slots = {}
+    shares = []
+    for case_id, parent_id, percentage in parent_cases.values_list('case_id', 'parent_id', 'percentage').iterator():
+        index = case_index.get(case_id)
+        if index is None:
+            index = case_index[case_id] = len(shares)
+            shares.append([0, 0, 0])
+        # Même ordre que Case.parent1 / Case.parent2 ; le troisième élément compte les parents vus
+        slot = shares[index][2]
+        if slot > 1:
+            continue
+        slots[(case_id, parent_id)] = slot
+        shares[index][slot] = to_basis_points(percentage)
+        shares[index][2] += 1
+
+    return case_index, slots, np.array(shares, dtype=np.int64).reshape(-1, 3)[:, :2]
+
+
+def compute_case_balances(case_ids=None, year=None, quarter=None, status='validated'):
+    """
+    Soldes de nombreux dossiers en une passe : les Documents sont chargés en colonnes
+    (dossier, rang du parent, montant en cents) puis agrégés avec NumPy.
+    """
+    case_index, slots, shares = load_parent_shares(case_ids)
+
+    documents = Document.objects.filter(case__isnull=False, status=status, **period_filter(year, quarter))
+    if case_ids is not None:
+        documents = documents.filter(case_id__in=case_ids)
+    rows = documents.values_list('case_id', 'user_id', 'amount').iterator(chunk_size=5000)
+    columns = np.array(
+        [(case_index.get(case_id, -1), slots.get((case_id, user_id), -1), to_cents(amount)) for case_id, user_id, amount in rows],
+        dtype=np.int64,
+    ).reshape(-1, 3)
+
+    # Les paiements d'un utilisateur qui n'est plus parent du dossier sont ignorés
+    columns = columns[columns[:, 1] >= 0]
+    totals = np.zeros((len(case_index), 2), dtype=np.int64)
+    np.add.at(totals, (columns[:, 0], columns[:, 1]), columns[:, 2])
+
+    result = settle(totals[:, 0], totals[:, 1], shares[:, 0], shares[:, 1])
+    result.update({
+        'case_ids': list(case_index),
+        'parent1_total': totals[:, 0],
+        'parent2_total': totals[:, 1],
+    })
+    return result
@@ -0,0 +1,122 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import CacheVersion, Category, CategoryType
+
+
+def get_cache_version(key):
+    return CacheVersion.objects.filter(key=key).values_list('version', flat=True).first() or 0
+
+
+def bump_cache_version(key):
+    if not CacheVersion.objects.filter(key=key).update(version=F('version') + 1):
+        version, created = CacheVersion.objects.get_or_create(key=key, defaults={'version': 1})
+        if not created:
+            CacheVersion.objects.filter(key=key).update(version=F('version') + 1)
+
+
+class VersionedCache:
+    """
+    Valeur gardée en mémoire par chaque worker et rechargée quand le compteur
+    CacheVersion `key` change. Le compteur n'est relu qu'une fois toutes les
+    CACHE_VERSION_CHECK_INTERVAL secondes.
+    """
+
+    def __init__(self, key, loader):
+        self.key = key
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._value = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def get(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < settings.CACHE_VERSION_CHECK_INTERVAL:
+            return self._value
+
+        with self._lock:
+            version = get_cache_version(self.key)
+            if version != self._version:
+                self._value = self.loader()
+                self._version = version
+            self._checked_at = now
+            return self._value
+
+    def get_version(self):
+        # Version de la valeur actuellement servie, utile dans une clé de cache dérivée
+        self.get()
+        return self._version
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+
+    def invalidate(self):
+        """Signale le changement à tous les workers ; celui-ci recharge dès la validation."""
+        bump_cache_version(self.key)
+        transaction.on_commit(self.clear)
+
+
+def _load_category_catalogue():
+    categories = list(Category.objects.select_related('type').order_by('type', 'name'))
+    grouped = OrderedDict()
+    for category in categories:
+        grouped.setdefault(category.type, []).append(category)
+    return {
+        'categories': categories,
+        'by_id': {str(category.pk): category for category in categories},
+        'grouped': grouped,
+        'types_by_name': {category_type.name: category_type for category_type in CategoryType.objects.all()},
+    }
+
+
+category_catalogue = VersionedCache('categories', _load_category_catalogue)
+
+
+def get_categories():
+    return category_catalogue.get()['categories']
+
+
+def get_category(pk):
+    # Une catégorie créée par un autre worker peut manquer jusqu'à la prochaine vérification
+    category = category_catalogue.get()['by_id'].get(str(pk))
+    if category is None:
+        category = Category.objects.select_related('type').filter(pk=pk).first()
+    return category
+
+
+def get_grouped_categories():
+    return category_catalogue.get()['grouped']
+
+
+def get_category_type(name):
+    category_type = category_catalogue.get()['types_by_name'].get(name)
+    if category_type is None:
+        category_type, created = CategoryType.objects.get_or_create(name=name)
+    return category_type
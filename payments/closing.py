@@ -0,0 +1,82 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from datetime import date
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .ledger import ledger_rows
+from .models import Case, ClosedPeriod, Document
+from .periods import period_filter, quarter_of, quarter_range
+
+
+class PeriodClosedError(ValidationError):
+    pass
+
+
+def get_closed_quarters(case_id):
+    return set(ClosedPeriod.objects.filter(case_id=case_id).values_list('year', 'quarter'))
+
+
+def check_period_open(document_date, closed_quarters):
+    """Lève PeriodClosedError si `document_date` tombe dans un des trimestres clôturés `closed_quarters`."""
+    if isinstance(document_date, str):
+        document_date = date.fromisoformat(document_date)
+    if document_date is None or (document_date.year, quarter_of(document_date)) not in closed_quarters:
+        return
+    raise PeriodClosedError(
+        f"Le trimestre {quarter_of(document_date)} de {document_date.year} est clôturé : "
+        f"enregistrez une régularisation dans un trimestre ouvert."
+    )
+
+
+@transaction.atomic
+def close_period(case, year, quarter, user=None):
+    """
+    Clôture un trimestre terminé du dossier : les totaux par catégorie et par parent et
+    les pourcentages sont figés dans un ClosedPeriod, et les paiements de la période ne
+    peuvent plus être modifiés.
+    """
+    start, end = quarter_range(year, quarter)
+    if end > date.today():
+        raise ValidationError("Seul un trimestre terminé peut être clôturé.")
+    # Verrou sur le dossier : une double soumission attend la première clôture puis la voit, au lieu d'une IntegrityError
+    Case.objects.select_for_update().only('pk').get(pk=case.pk)
+    if ClosedPeriod.objects.filter(case=case, year=year, quarter=quarter).exists():
+        raise ValidationError("Ce trimestre est déjà clôturé.")
+    if Document.objects.filter(case=case, status='pending', **period_filter(year, quarter)).exists():
+        raise ValidationError("Des paiements de ce trimestre sont encore en attente de validation.")
+
+    parent_cases = case.ordered_parent_cases[:2]
+    percentages = [parent_case.percentage for parent_case in parent_cases]
+    percentages += [0] * (2 - len(percentages))
+    rows = ledger_rows(case, case.parent1, case.parent2).filter(year=year, quarter=quarter)
+    return ClosedPeriod.objects.create(
+        case=case,
+        year=year,
+        quarter=quarter,
+        closed_by=user,
+        snapshot={
+            'parents': [parent_case.parent_id for parent_case in parent_cases],
+            'percentages': [str(percentage) for percentage in percentages],
+            'rows': list(rows),
+        },
+    )
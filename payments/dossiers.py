@@ -0,0 +1,115 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import csv
+import io
+import os
+import zipfile
+
+from django.http import StreamingHttpResponse
+
+from .exports import escape_cell
+from .models import Document
+from .statements import render_statement, statement_filename, statement_path, statement_period
+
+DOSSIER_CHUNK_SIZE = 64 * 1024
+INDEX_HEADER = ['date', 'parent', 'category', 'amount', 'status', 'receipt']
+
+
+class ZipStream:
+    """
+    Fichier en écriture seule et non positionnable : zipfile écrit alors des descripteurs
+    de données après chaque fichier, et les octets produits peuvent être envoyés au fur et à mesure.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def receipt_arcname(document):
+    return f"receipts/{document.date:%Y-%m-%d}_{str(document.pk)[:8]}_{os.path.basename(document.document.name)}"
+
+
+def statement_bytes(case):
+    # Le relevé déjà en cache est repris tel quel ; sinon il est rendu une seule fois, pendant l'envoi
+    path = statement_path(case, None, None)
+    if os.path.exists(path):
+        with open(path, 'rb') as statement:
+            return statement.read()
+    return render_statement(case)
+
+
+def dossier_chunks(case):
+    stream = ZipStream()
+    documents = Document.objects.filter(case=case).select_related('user', 'category').order_by('date', 'id')
+
+    with zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(statement_filename(*statement_period()), statement_bytes(case))
+        yield stream.pop()
+
+        index = io.StringIO()
+        writer = csv.writer(index)
+        writer.writerow(INDEX_HEADER)
+        receipts = []
+        for document in documents.iterator():
+            arcname = ''
+            if document.document:
+                if document.document.storage.exists(document.document.name):
+                    arcname = receipt_arcname(document)
+                    receipts.append((arcname, document.document))
+                else:
+                    arcname = 'missing'
+            writer.writerow([
+                document.date.isoformat(), escape_cell(document.user.get_full_name()), escape_cell(document.category.name),
+                document.amount, document.status, arcname,
+            ])
+        archive.writestr('index.csv', index.getvalue())
+        yield stream.pop()
+
+        # Les justificatifs (JPEG/PNG) sont déjà compressés : ils sont stockés tels quels
+        for arcname, receipt in receipts:
+            document_date = receipt.instance.date
+            info = zipfile.ZipInfo(arcname, date_time=(document_date.year, document_date.month, document_date.day, 0, 0, 0))
+            with receipt.open('rb'), archive.open(info, mode='w', force_zip64=True) as entry:
+                for chunk in receipt.chunks(DOSSIER_CHUNK_SIZE):
+                    entry.write(chunk)
+                    yield stream.pop()
+            yield stream.pop()
+
+    yield stream.pop()
+
+
+def dossier_response(case):
+    chunks = (chunk for chunk in dossier_chunks(case) if chunk)
+    response = StreamingHttpResponse(chunks, content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="dossier_{case.pk}.zip"'
+    return response
@@ -0,0 +1,119 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import csv
+import tempfile
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+
+from .models import Document
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # l'export XLSX est optionnel
+    Workbook = None
+
+EXPORT_HEADER = ['case', 'date', 'parent', 'category', 'type', 'amount', 'status', 'receipt']
+
+EXPORT_FIELDS = (
+    'case_id', 'date', 'user__first_name', 'user__last_name', 'category__name', 'category__type__name',
+    'amount', 'status', 'document',
+)
+
+# Un tableur interprète comme une formule une cellule qui commence par l'un de ces caractères
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def escape_cell(value):
+    """Neutralise une valeur texte qui serait lue comme une formule (injection CSV)."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+class Echo:
+    """Tampon minimal pour csv.writer : chaque ligne écrite est renvoyée telle quelle."""
+
+    def write(self, value):
+        return value
+
+
+def ledger_rows(case_ids, request=None):
+    """
+    Lignes du grand livre des dossiers `case_ids` (liste ou sous-requête), lues par
+    paquets via un curseur côté serveur : la mémoire reste constante quelle que soit la taille.
+    """
+    storage = Document._meta.get_field('document').storage
+    documents = Document.objects.filter(case_id__in=case_ids).order_by('case_id', 'date', 'id').values_list(*EXPORT_FIELDS)
+    for case_id, date, first_name, last_name, category, category_type, amount, status, receipt in documents.iterator(
+            chunk_size=settings.EXPORT_CHUNK_SIZE):
+        if receipt:
+            receipt = storage.url(receipt)
+            if request is not None:
+                receipt = request.build_absolute_uri(receipt)
+        yield [
+            str(case_id), date.isoformat(), escape_cell(f"{first_name} {last_name}".strip()), escape_cell(category),
+            escape_cell(category_type), amount, status, escape_cell(receipt or ''),
+        ]
+
+
+def stream_csv(rows, filename):
+    writer = csv.writer(Echo())
+
+    def content():
+        yield writer.writerow(EXPORT_HEADER)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(content(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def xlsx_response(rows, filename):
+    # Un XLSX est une archive zip, qui ne peut pas être envoyée avant d'être complète : contrairement au CSV,
+    # le classeur est d'abord écrit en entier (write_only, sur disque) dans un fichier temporaire, puis servi par morceaux
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Ledger')
+    sheet.append(EXPORT_HEADER)
+    for row in rows:
+        sheet.append(row)
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f'{filename}.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+
+
+def xlsx_available():
+    return Workbook is not None
+
+
+def export_response(case_ids, filename, export_format='csv', request=None):
+    rows = ledger_rows(case_ids, request)
+    if export_format == 'xlsx':
+        return xlsx_response(rows, filename)
+    return stream_csv(rows, filename)
@@ -24,14 +24,32 @@ from django import forms
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 from django.utils import timezone
+from django.utils.translation import gettext as _
 
 from accounts.models import ParentCase
 from accounts.views import User
+from .caches import get_categories, get_category
+from .closing import check_period_open
 from .models import Document, Case, Category, Child
 
 
+class CatalogueCategoryField(forms.ModelChoiceField):
+    # Valide la catégorie à partir du catalogue en mémoire plutôt que par une requête par formulaire
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            category = get_category(value)
+        except (ValueError, ValidationError):
+            category = None
+        if category is None:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value})
+        return category
+
+
 class PaymentDocumentForm(forms.ModelForm):
     parent = forms.ChoiceField(choices=(), required=False)
+    category = CatalogueCategoryField(queryset=Category.objects.all())
     amount = forms.DecimalField(max_digits=10, decimal_places=2, validators=[
         RegexValidator(regex=r'^\d+(\.\d{1,2})?$', message='Veuillez entrer un montant valide avec jusqu\'à deux décimales.')
     ])
@@ -45,9 +63,15 @@ class PaymentDocumentForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         parent_choices = kwargs.pop('parent_choices', None)
+        # Trimestres clôturés du dossier (voir payments.closing), où aucun paiement ne peut être ajouté
+        self.closed_quarters = kwargs.pop('closed_quarters', set())
         super().__init__(*args, **kwargs)
 
-        self.fields['category'].queryset = Category.objects.order_by('type', 'name')
+        # Les choix viennent du catalogue en mémoire ; le queryset ne sert qu'à valider la saisie
+        self.fields['category'].queryset = Category.objects.all()
+        self.fields['category'].choices = [('', self.fields['category'].empty_label)] + [
+            (category.pk, str(category)) for category in get_categories()
+        ]
         self.fields['category'].required = True
 
         if parent_choices:
@@ -61,6 +85,11 @@ class PaymentDocumentForm(forms.ModelForm):
             raise ValidationError('Ce champ est obligatoire.')
         return category
 
+    def clean_date(self):
+        document_date = self.cleaned_data.get('date')
+        check_period_open(document_date, self.closed_quarters)
+        return document_date
+
     def clean_document(self):
         document = self.cleaned_data.get('document')
         if document:
@@ -71,6 +100,36 @@ class PaymentDocumentForm(forms.ModelForm):
         return document
 
 
+class BasePaymentDocumentFormSet(forms.BaseFormSet):
+    def clean(self):
+        super().clean()
+        if not any(form.has_changed() for form in self.forms):
+            raise ValidationError(_("Aucun paiement à ajouter."))
+
+
+PaymentDocumentFormSet = forms.formset_factory(PaymentDocumentForm, formset=BasePaymentDocumentFormSet, extra=5,
+                                               max_num=50, validate_max=True)
+
+
+class ImportPaymentsForm(forms.Form):
+    FORMAT_CHOICES = (
+        ('csv', 'CSV'),
+        ('camt', 'CAMT.053 (XML)'),
+    )
+    file = forms.FileField()
+    format = forms.ChoiceField(choices=FORMAT_CHOICES)
+    parent = forms.ChoiceField(choices=(), required=False)
+
+    def __init__(self, *args, **kwargs):
+        parent_choices = kwargs.pop('parent_choices', None)
+        super().__init__(*args, **kwargs)
+
+        if parent_choices:
+            self.fields['parent'].choices = parent_choices
+        else:
+            self.fields['parent'].widget = forms.HiddenInput()
+
+
 class CaseForm(forms.ModelForm):
     parent1 = forms.ModelChoiceField(queryset=User.objects.filter(role='parent'), required=True)
     parent2 = forms.ModelChoiceField(queryset=User.objects.filter(role='parent'), required=False)
@@ -144,8 +203,9 @@ class CombineDraftsForm(forms.Form):
         initial_draft1 = kwargs.pop('initial_draft1', None)
         super(CombineDraftsForm, self).__init__(*args, **kwargs)
         if user:
-            self.fields['draft1'].queryset = Case.objects.filter(draft=True, parent1=user)
-            self.fields['draft2'].queryset = Case.objects.filter(draft=True).exclude(parent1=user)
+            # Les libellés viennent de Case.display_name : une seule requête par liste, sans charger les parents
+            self.fields['draft1'].queryset = Case.objects.filter(draft=True, parent_cases__parent=user).order_by('display_name')
+            self.fields['draft2'].queryset = Case.objects.filter(draft=True).exclude(parent_cases__parent=user).order_by('display_name')
 
             self.fields['draft1'].label_from_instance = self.label_from_instance
             self.fields['draft2'].label_from_instance = self.label_from_instance
@@ -153,13 +213,12 @@ class CombineDraftsForm(forms.Form):
             if initial_draft1:
                 self.fields['draft1'].initial = initial_draft1
                 self.fields['draft1'].queryset = Case.objects.filter(id=initial_draft1.id)
-                self.fields['draft2'].queryset = self.fields['draft2'].queryset.exclude(parent1=initial_draft1.parent1)
+                self.fields['draft2'].queryset = self.fields['draft2'].queryset.exclude(parent_cases__parent=initial_draft1.parent1)
 
     def label_from_instance(self, obj):
-        parent = obj.parent1
         created_at = obj.created_at.strftime("%Y-%m-%d %H:%M")
         updated_at = obj.updated_at.strftime("%Y-%m-%d %H:%M")
-        return f"{parent.last_name} {parent.first_name[0]}. | Created: {created_at} | Updated: {updated_at}"
+        return f"{obj.display_name} | Created: {created_at} | Updated: {updated_at}"
 
 
 class ValidatePaymentsForm(forms.Form):
@@ -0,0 +1,252 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import csv
+import io
+import xml.etree.ElementTree as ElementTree
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .caches import get_categories
+from .closing import check_period_open, get_closed_quarters
+from .forms import PaymentDocumentForm
+from .models import Document
+from .summaries import document_entry, record_document_changes
+
+IMPORT_BATCH_SIZE = 500
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y')
+
+# Mots-clés recherchés dans le libellé d'une ligne quand sa catégorie n'est pas donnée ;
+# complétés ou remplacés par le réglage PAYMENT_IMPORT_KEYWORDS
+DEFAULT_KEYWORDS = {
+    'pharmacie': 'Traitement médecin/médicament',
+    'orthodont': 'Orthodontie',
+    'logop': 'Logopédie',
+    'ophtalm': 'Ophtalmologie',
+    'kiné': 'Kinésithérapie',
+    'opticien': 'Lunettes de vue',
+    'psycho': 'Psychiatre/Psychologue',
+    'hospitalisation': 'Assurance hospitalisation',
+    'crèche': 'Garderie (0 à 3 ans)',
+    'garderie': 'Garderie (0 à 3 ans)',
+    'stage': 'Camps/Stage',
+    'auto-école': 'Permis de conduire',
+    'minerval': 'Inscription',
+}
+
+
+class ImportFileError(Exception):
+    pass
+
+
+class ImportRow:
+    __slots__ = ('line', 'date', 'amount', 'category', 'label', 'parent')
+
+    def __init__(self, line, date=None, amount=None, category=None, label='', parent=None):
+        self.line = line
+        self.date = date
+        self.amount = amount
+        self.category = category
+        self.label = label
+        self.parent = parent
+
+
+def parse_csv(stream):
+    """
+    Lignes d'un export CSV, lues au fil du fichier. Colonnes reconnues : date, amount
+    (ou montant), category (ou categorie), label (ou libelle, communication) et parent (e-mail).
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    first_line = text.readline()
+    try:
+        dialect = csv.Sniffer().sniff(first_line, delimiters=';,\t')
+    except csv.Error:
+        dialect = csv.excel
+    header = [column.strip().lower() for column in next(csv.reader([first_line], dialect))]
+
+    def column(values, *names):
+        for name in names:
+            if name in values and values[name] is not None:
+                return values[name].strip()
+        return ''
+
+    reader = csv.DictReader(text, fieldnames=header, dialect=dialect)
+    for values in reader:
+        yield ImportRow(
+            reader.line_num + 1,  # l'en-tête a été lu à part
+            date=column(values, 'date'),
+            amount=column(values, 'amount', 'montant'),
+            category=column(values, 'category', 'categorie', 'catégorie'),
+            label=column(values, 'label', 'libelle', 'libellé', 'communication', 'description'),
+            parent=column(values, 'parent', 'email') or None,
+        )
+
+
+def parse_camt(stream):
+    """
+    Débits d'un relevé bancaire CAMT.053/054, lus avec iterparse : chaque écriture
+    est libérée dès qu'elle est traitée, quelle que soit la taille du fichier.
+    """
+    def local(tag):
+        return tag.rsplit('}', 1)[-1]
+
+    def find(element, name):
+        if element is not None:
+            for child in element.iter():
+                if local(child.tag) == name:
+                    return child
+        return None
+
+    def text(element):
+        return (element.text or '').strip() if element is not None else ''
+
+    line = 0
+    for event, element in ElementTree.iterparse(stream, events=('end',)):
+        if local(element.tag) != 'Ntry':
+            continue
+        line += 1
+        if text(find(element, 'CdtDbtInd')) == 'DBIT':
+            booking_date = find(element, 'BookgDt')
+            labels = [text(find(element, 'Ustrd')), text(find(element, 'AddtlNtryInf'))]
+            yield ImportRow(
+                line,
+                date=text(find(booking_date, 'Dt')) or text(find(booking_date, 'DtTm'))[:10],
+                amount=text(find(element, 'Amt')),
+                label=' '.join(label for label in labels if label),
+            )
+        element.clear()
+
+
+PARSERS = {
+    'csv': parse_csv,
+    'camt': parse_camt,
+}
+
+
+class CategoryMatcher:
+    # Nom exact (sans tenir compte de la casse), puis mots-clés du libellé, puis catégorie par défaut
+    def __init__(self, default=None):
+        self.by_name = {category.name.lower(): category for category in get_categories()}
+        keywords = dict(DEFAULT_KEYWORDS, **getattr(settings, 'PAYMENT_IMPORT_KEYWORDS', {}))
+        self.keywords = [
+            (keyword.lower(), self.by_name[name.lower()]) for keyword, name in keywords.items() if name.lower() in self.by_name
+        ]
+        self.default = self.by_name.get(default.lower()) if default else None
+
+    def match(self, row):
+        if row.category:
+            return self.by_name.get(row.category.lower())
+        label = row.label.lower()
+        for keyword, category in self.keywords:
+            if keyword in label:
+                return category
+        return self.default
+
+
+def parse_date(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ValidationError(f"Invalid date '{value}'.")
+
+
+def clean_amount(value):
+    # Les exports bancaires utilisent souvent la virgule décimale
+    value = value.replace(' ', '')
+    if value.startswith('-'):
+        # Remboursement ou crédit : ce n'est pas un paiement
+        raise ValidationError('Negative amounts (refunds, credits) cannot be imported.')
+    if ',' in value and '.' not in value:
+        value = value.replace(',', '.')
+    return PaymentDocumentForm.base_fields['amount'].clean(value)
+
+
+def build_document(row, case, parents, matcher, default_parent, status, closed_quarters=frozenset()):
+    category = matcher.match(row)
+    if category is None:
+        raise ValidationError(f"No category matches '{row.category or row.label}'.")
+
+    if row.parent:
+        parent = parents.get(row.parent.lower())
+        if parent is None:
+            raise ValidationError(f"{row.parent} cannot be recorded as the payer in this import.")
+    elif default_parent is not None:
+        parent = default_parent
+    else:
+        raise ValidationError('The parent is required.')
+
+    document_date = parse_date(row.date)
+    if document_date > date.today():
+        raise ValidationError('The date cannot be in the future.')
+    check_period_open(document_date, closed_quarters)
+
+    return Document(case=case, user=parent, category=category, amount=clean_amount(row.amount), date=document_date,
+                    status=status)
+
+
+def import_payments(case, rows, default_parent=None, default_category=None, status='validated', dry_run=False,
+                    allowed_parents=None):
+    """
+    Importe les lignes `rows` (ImportRow) dans le dossier. Les lignes valides sont insérées
+    par lots avec bulk_create dans une seule transaction ; les autres sont signalées avec leur
+    numéro de ligne. Retourne {'created': n, 'errors': [(ligne, message), ...]}.
+
+    `allowed_parents` restreint les payeurs acceptés (par défaut, les parents du dossier) :
+    un parent qui importe ne peut enregistrer que ses propres paiements.
+    """
+    parents = {parent.email.lower(): parent for parent in (case.parents if allowed_parents is None else allowed_parents)}
+    matcher = CategoryMatcher(default_category)
+    closed_quarters = get_closed_quarters(case.pk)
+    created = 0
+    errors = []
+    batch = []
+
+    with transaction.atomic():
+        try:
+            for row in rows:
+                try:
+                    batch.append(build_document(row, case, parents, matcher, default_parent, status, closed_quarters))
+                except ValidationError as e:
+                    errors.append((row.line, ' '.join(e.messages)))
+                    continue
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    created += _flush_batch(batch, dry_run)
+        except (csv.Error, ElementTree.ParseError, UnicodeDecodeError) as e:
+            # Fichier illisible : rien n'est importé
+            raise ImportFileError(str(e)) from e
+
+        created += _flush_batch(batch, dry_run)
+
+    return {'created': created, 'errors': errors}
+
+
+def _flush_batch(batch, dry_run):
+    count = len(batch)
+    if count and not dry_run:
+        Document.objects.bulk_create(batch, batch_size=IMPORT_BATCH_SIZE)
+        # bulk_create n'envoie pas les signaux qui tiennent CaseBalanceSummary à jour
+        record_document_changes([(None, document_entry(document)) for document in batch])
+    batch.clear()
+    return count
@@ -0,0 +1,72 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from bisect import bisect_right
+from decimal import Decimal
+
+from .caches import VersionedCache
+from .models import IndexHistory
+
+
+def _load_index_table():
+    history = list(IndexHistory.objects.order_by('year', 'created_at'))
+    by_year = {}
+    for index in history:
+        # Plusieurs indexations la même année : la dernière créée fait foi
+        by_year[index.year] = index
+    return {
+        'history': history,
+        'current': max(history, key=lambda index: index.created_at, default=None),
+        'by_year': by_year,
+        'years': sorted(by_year),
+    }
+
+
+# L'indexation change une fois par an : la table est gardée en mémoire et rechargée après chaque écriture
+index_table = VersionedCache('indexation', _load_index_table)
+
+
+def get_index_history():
+    return index_table.get()['history']
+
+
+def get_current_index():
+    return index_table.get()['current']
+
+
+def has_index_for_year(year):
+    return year in index_table.get()['by_year']
+
+
+def get_index_for_year(year):
+    """Indexation en vigueur pendant `year` : celle de l'année ou, à défaut, de la dernière année indexée avant."""
+    table = index_table.get()
+    position = bisect_right(table['years'], year)
+    if not position:
+        return None
+    return table['by_year'][table['years'][position - 1]]
+
+
+def get_contribution_amount(number_of_children, year=None):
+    # Montant de l'indexation courante, ou de celle en vigueur pendant `year`, pour tous les enfants
+    index = get_current_index() if year is None else get_index_for_year(year)
+    if index is None:
+        return Decimal('0.00')
+    return index.amount * number_of_children
@@ -0,0 +1,176 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from decimal import Decimal
+
+from django.db.models import Sum, Q
+
+from .accrual import get_case_accrual
+from .balance import settle_case
+from .indexation import get_contribution_amount
+from .models import CaseBalanceSummary, ClosedPeriod
+
+LEDGER_COLUMNS = (
+    ('parent1_amount', 0, 'validated'),
+    ('parent2_amount', 1, 'validated'),
+    ('parent1_pending_amount', 0, 'pending'),
+    ('parent2_pending_amount', 1, 'pending'),
+)
+
+
+def get_case_ledger(case, parent1, parent2, year=None, quarter=None):
+    """
+    Totaux par parent, statut et catégorie d'un dossier, en une seule requête.
+
+    Les lignes sont lues dans CaseBalanceSummary et groupées par (type, catégorie,
+    année, trimestre) : le filtre de période est appliqué ici, ce qui permet de
+    lister aussi les années et trimestres actifs sans requête supplémentaire.
+    Un trimestre clôturé est lu dans l'instantané de son ClosedPeriod.
+    """
+    closed_period = None
+    if year is not None and quarter is not None:
+        closed_period = ClosedPeriod.objects.filter(case=case, year=year, quarter=quarter).first()
+
+    if closed_period is None:
+        ledger = build_ledger(ledger_rows(case, parent1, parent2), year, quarter)
+    else:
+        ledger = build_ledger(closed_ledger_rows(closed_period.snapshot), year, quarter)
+        # Le filtre de période propose toujours tous les trimestres actifs du dossier
+        active_quarters_per_year = {}
+        periods = CaseBalanceSummary.objects.filter(case=case).values_list('year', 'quarter').order_by().distinct()
+        for active_year, active_quarter in periods:
+            active_quarters_per_year.setdefault(active_year, set()).add(active_quarter)
+        ledger['years'] = sorted(active_quarters_per_year)
+        ledger['active_quarters_per_year'] = {y: active_quarters_per_year[y] for y in ledger['years']}
+
+    ledger['closed_period'] = closed_period
+    return ledger
+
+
+def ledger_rows(case, parent1, parent2):
+    parents = (parent1, parent2)
+    aggregates = {}
+    for column, index, status in LEDGER_COLUMNS:
+        if parents[index] is None:
+            continue
+        aggregates[column] = Sum('total', filter=Q(parent=parents[index], status=status))
+
+    return CaseBalanceSummary.objects.filter(case=case).values(
+        'category__type', 'category__type__name', 'category', 'category__name', 'year', 'quarter',
+    ).annotate(**aggregates).order_by('category__type__name', 'category__name')
+
+
+def closed_ledger_rows(snapshot):
+    # Les montants sont enregistrés en texte dans le JSON de l'instantané
+    for row in snapshot['rows']:
+        yield dict(row, **{
+            column: Decimal(row[column]) for column, index, status in LEDGER_COLUMNS if row.get(column) is not None
+        })
+
+
+def build_ledger(rows, year=None, quarter=None):
+    categories_by_type = {}
+    categories = {}
+    active_quarters_per_year = {}
+
+    for row in rows:
+        active_quarters_per_year.setdefault(row['year'], set()).add(row['quarter'])
+
+        if year is not None and (row['year'] != year or quarter is not None and row['quarter'] != quarter):
+            continue
+
+        amounts = [row.get(column) or 0 for column, index, status in LEDGER_COLUMNS]
+        if not any(amounts):
+            continue
+
+        category_id = row['category']
+        entry = categories.get(category_id)
+        if entry is None:
+            type_id = row['category__type']
+            if type_id not in categories_by_type:
+                categories_by_type[type_id] = {
+                    'type_name': row['category__type__name'],
+                    'categories': [],
+                }
+            entry = {
+                'category_id': category_id,
+                'category_name': row['category__name'],
+            }
+            entry.update({column: 0 for column, index, status in LEDGER_COLUMNS})
+            categories[category_id] = entry
+            categories_by_type[type_id]['categories'].append(entry)
+
+        for (column, index, status), amount in zip(LEDGER_COLUMNS, amounts):
+            entry[column] += amount
+
+    parent1_total = sum((entry['parent1_amount'] for entry in categories.values()), Decimal('0.00'))
+    parent2_total = sum((entry['parent2_amount'] for entry in categories.values()), Decimal('0.00'))
+    years = sorted(active_quarters_per_year)
+
+    return {
+        'categories_by_type': categories_by_type,
+        'category_ids': list(categories),
+        'parent1_total': parent1_total,
+        'parent2_total': parent2_total,
+        'years': years,
+        'active_quarters_per_year': {y: active_quarters_per_year[y] for y in years},
+    }
+
+
+def build_payment_history_context(case, year=None, quarter=None):
+    # Contexte partagé par l'historique des paiements et son export PDF
+    parent1 = case.parent1
+    parent2 = case.parent2
+
+    contribution_amount = get_contribution_amount(case.number_of_children)
+
+    ledger = get_case_ledger(case, parent1, parent2, year, quarter)
+
+    if ledger['closed_period'] is not None:
+        # Trimestre clôturé : les pourcentages en vigueur à la clôture
+        parent1_percentage, parent2_percentage = (Decimal(value) for value in ledger['closed_period'].snapshot['percentages'])
+    else:
+        # Calculer les pourcentages à partir des ParentCase
+        percentages = {parent_case.parent_id: parent_case.percentage for parent_case in case.ordered_parent_cases}
+        parent1_percentage = percentages.get(parent1.id, 0) if parent1 else 0
+        parent2_percentage = percentages.get(parent2.id, 0) if parent2 else 0
+    parent1_total = ledger['parent1_total']
+    parent2_total = ledger['parent2_total']
+
+    balance = settle_case(parent1_total, parent2_total, parent1_percentage, parent2_percentage)
+
+    context = {
+        'case': case,
+        'parent1_user': parent1,
+        'parent2_user': parent2,
+        'total_amount': parent1_total + parent2_total,
+        'parent1_due': balance['parent1_due'],
+        'parent2_due': balance['parent2_due'],
+        'difference': abs(balance['net']),
+        'in_favor_of': parent1 if balance['net'] > 0 else parent2,
+        'is_draft': case.draft,
+        'contribution_amount': contribution_amount,
+        'parent1_percentage': parent1_percentage,
+        'parent2_percentage': parent2_percentage,
+    }
+    context.update(ledger)
+    # Même période que le détail ci-dessus
+    context.update(get_case_accrual(case, year, quarter))
+    return context
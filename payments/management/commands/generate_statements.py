@@ -0,0 +1,100 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from payments.models import Case
+from payments.statements import init_statement_worker, render_statement_file
+
+MANIFEST_FIELDS = ['case', 'file', 'size', 'seconds', 'error']
+
+
+#  $ python manage.py generate_statements --year 2024 [--quarter 4] [--lawyer avocat@example.com] [--workers 4]
+class Command(BaseCommand):
+    help = 'Renders the payment history statements of a portfolio on a process pool, with a manifest.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, required=True)
+        parser.add_argument('--quarter', type=int, choices=[1, 2, 3, 4])
+        parser.add_argument('--lawyer', help='E-mail or id of the lawyer whose cases are rendered (default: all cases).')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Rendering processes.')
+        parser.add_argument('--output', help='Output directory (default: STATEMENT_ROOT/batches/<date>_<period>).')
+
+    def handle(self, *args, **options):
+        year, quarter = options['year'], options['quarter']
+
+        cases = Case.objects.filter(draft=False)
+        if options['lawyer']:
+            lawyer = self.get_lawyer(options['lawyer'])
+            cases = cases.filter(memberships__user=lawyer, memberships__role='lawyer')
+        case_ids = list(cases.values_list('id', flat=True).distinct())
+        if not case_ids:
+            raise CommandError('No case to render.')
+
+        period = f'{year}_Q{quarter}' if quarter else str(year)
+        directory = options['output'] or os.path.join(
+            settings.STATEMENT_ROOT, 'batches', f'{timezone.now():%Y-%m-%d}_{period}'
+        )
+        os.makedirs(directory, exist_ok=True)
+
+        # Les connexions ne doivent pas être partagées avec les processus fils
+        connections.close_all()
+
+        started = time.monotonic()
+        results = []
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_statement_worker) as executor:
+            futures = [executor.submit(render_statement_file, case_id, year, quarter, directory) for case_id in case_ids]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                if result['error']:
+                    self.stderr.write(f"Case {result['case']}: {result['error']}")
+        elapsed = time.monotonic() - started
+
+        with open(os.path.join(directory, 'manifest.csv'), 'w', newline='') as manifest:
+            writer = csv.DictWriter(manifest, fieldnames=MANIFEST_FIELDS)
+            writer.writeheader()
+            writer.writerows(sorted(results, key=lambda result: result['case']))
+
+        failed = sum(1 for result in results if result['error'])
+        rendered = len(results) - failed
+        rate = rendered / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'SUCCES: {rendered} statements rendered in {elapsed:.1f}s ({rate:.2f} statements/s, '
+            f'{options["workers"]} workers), {failed} failed. Output: {directory}'
+        ))
+
+    def get_lawyer(self, value):
+        User = get_user_model()
+        lookup = {'email': value} if '@' in value else {'pk': value}
+        try:
+            return User.objects.get(role='lawyer', **lookup)
+        except (User.DoesNotExist, ValueError, ValidationError):
+            raise CommandError(f'Unknown lawyer {value}.')
@@ -0,0 +1,72 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.imports import PARSERS, ImportFileError, import_payments
+from payments.models import Case
+
+
+#  $ python manage.py import_payments --case <uuid> --file export.csv [--format csv|camt] [--parent parent@example.com]
+#                                     [--default-category Autre] [--status pending] [--dry-run]
+class Command(BaseCommand):
+    help = 'Imports payment documents from a CSV or CAMT bank export, with a per-row error report.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--case', required=True)
+        parser.add_argument('--file', required=True)
+        parser.add_argument('--format', choices=sorted(PARSERS), default='csv')
+        parser.add_argument('--parent', help='E-mail of the parent used for rows without a parent column.')
+        parser.add_argument('--default-category', help='Category used when neither the name nor a keyword matches.')
+        parser.add_argument('--status', choices=['validated', 'pending'], default='validated')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the file without inserting anything.')
+
+    def handle(self, *args, **options):
+        try:
+            case = Case.objects.with_parents().get(pk=options['case'])
+        except (Case.DoesNotExist, ValueError, ValidationError):
+            raise CommandError(f"Unknown case {options['case']}.")
+
+        default_parent = None
+        if options['parent']:
+            default_parent = next((parent for parent in case.parents if parent.email == options['parent']), None)
+            if default_parent is None:
+                raise CommandError(f"{options['parent']} is not a parent of this case.")
+
+        started = time.monotonic()
+        try:
+            with open(options['file'], 'rb') as stream:
+                report = import_payments(
+                    case, PARSERS[options['format']](stream), default_parent, options['default_category'],
+                    options['status'], options['dry_run'],
+                )
+        except (OSError, ImportFileError) as e:
+            raise CommandError(f"Cannot read {options['file']}: {e}")
+
+        for line, message in report['errors']:
+            self.stderr.write(f'Line {line}: {message}')
+        verb = 'validated' if options['dry_run'] else 'imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"SUCCES: {report['created']} payments {verb} in {time.monotonic() - started:.1f}s, "
+            f"{len(report['errors'])} rows rejected."
+        ))
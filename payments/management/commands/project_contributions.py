@@ -0,0 +1,79 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.models import Case
+from payments.projection import check_projection_options, project_contributions, projection_summary
+
+
+#  $ python manage.py project_contributions --case <uuid> --years 10 --rate 0 --rate 2 --rate 4
+#  $ python manage.py project_contributions --lawyer avocat@example.com --until-age 18
+class Command(BaseCommand):
+    help = 'Simulates the future alimentary contributions of a case or a portfolio under several indexation rates.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--case', action='append', dest='cases', default=[], help='Case id (repeatable).')
+        parser.add_argument('--lawyer', help='E-mail of the lawyer whose cases are projected (default: all cases).')
+        parser.add_argument('--years', type=int, help='Projection horizon in years (default: PROJECTION_DEFAULT_YEARS).')
+        parser.add_argument('--rate', type=float, action='append', dest='rates', help='Yearly indexation rate in % (repeatable).')
+        parser.add_argument('--until-age', type=int, help='Stop counting a child from this birthday (default: CONTRIBUTION_UNTIL_AGE).')
+
+    def handle(self, *args, **options):
+        try:
+            check_projection_options(options['years'], options['rates'], options['until_age'])
+        except ValidationError as e:
+            raise CommandError(' '.join(e.messages))
+
+        if options['cases']:
+            case_ids = options['cases']
+        else:
+            cases = Case.objects.filter(draft=False)
+            if options['lawyer']:
+                lawyer = get_user_model().objects.filter(email=options['lawyer'], role='lawyer').first()
+                if lawyer is None:
+                    raise CommandError(f"Unknown lawyer: {options['lawyer']}.")
+                cases = cases.filter(memberships__user=lawyer, memberships__role='lawyer')
+            case_ids = cases.values('id')
+
+        started = time.monotonic()
+        try:
+            result = project_contributions(case_ids, options['years'], options['rates'], options['until_age'])
+        except ValidationError:
+            # Un identifiant de dossier qui n'est pas un UUID
+            raise CommandError(f"Invalid case id in {', '.join(options['cases'])}.")
+        elapsed = time.monotonic() - started
+        summary = projection_summary(result)
+        if not summary['cases']:
+            raise CommandError('No case to project.')
+
+        self.stdout.write(f"Base amount per child: {summary['base_amount']} €, {summary['months']} months from {summary['start']}.")
+        for scenario in summary['scenarios']:
+            self.stdout.write(
+                f"{scenario['rate']:>6.2f} %: total {scenario['total']} € "
+                f"(parent 1: {scenario['parent1']} €, parent 2: {scenario['parent2']} €)"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"SUCCES: {summary['cases']} cases projected over {len(summary['scenarios'])} scenarios in {elapsed * 1000:.1f} ms."
+        ))
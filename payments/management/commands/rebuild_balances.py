@@ -0,0 +1,35 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from django.core.management.base import BaseCommand
+
+from payments.summaries import rebuild_case_balances
+
+
+#  $ python manage.py rebuild_balances [--case <uuid> ...]
+class Command(BaseCommand):
+    help = 'Recomputes the per-case, per-quarter balance summaries from the payment documents.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--case', action='append', dest='cases', help='Only rebuild the given case (repeatable).')
+
+    def handle(self, *args, **options):
+        count = rebuild_case_balances(options['cases'])
+        self.stdout.write(self.style.SUCCESS(f'SUCCES: {count} balance summaries rebuilt.'))
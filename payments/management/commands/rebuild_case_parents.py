@@ -0,0 +1,38 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from payments.models import Case
+
+
+#  $ python manage.py rebuild_case_parents
+class Command(BaseCommand):
+    help = 'Recomputes the fields copied from the parents of each case (duplicate detection key, display and search names).'
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                count = Case.objects.all().update_parent_fields()
+        except IntegrityError as e:
+            # Des dossiers actifs en double existent déjà : ils doivent être fusionnés ou passés en brouillon
+            raise CommandError(f'Duplicate active cases share the same parents, resolve them first ({e}).')
+        self.stdout.write(self.style.SUCCESS(f'SUCCES: {count} cases updated.'))
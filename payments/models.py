@@ -18,12 +18,16 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import unicodedata
 import uuid
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import Prefetch, Q
 from django.utils import timezone
+from django.utils.functional import cached_property
 
 
 class CategoryType(models.Model):
@@ -44,6 +48,15 @@ class Category(models.Model):
         return self.name
 
 
+class CacheVersion(models.Model):
+    # Compteur partagé par les workers pour savoir quand recharger un cache en mémoire (voir payments.caches)
+    key = models.CharField(max_length=50, unique=True)
+    version = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
+
+
 class Document(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),  # En attente de validation
@@ -59,9 +72,25 @@ class Document(models.Model):
     document = models.FileField(upload_to='payment_documents/', blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
 
+    class Meta:
+        # Les filtres par période sont des intervalles sur `date` (voir payments.periods)
+        indexes = [
+            models.Index(fields=['case', 'user', 'status', 'date'], name='doc_case_user_status_date_idx'),
+            models.Index(fields=['case', 'category', 'date'], name='doc_case_category_date_idx'),
+        ]
+
     def __str__(self):
         return f"Payment Document - {self.user.username} - {self.date} - {self.amount}"
 
+    # Les signaux mettent à jour CaseBalanceSummary dans la même transaction que le Document
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
     def user_can_delete(self, user):
         return self.user == user
 
@@ -69,16 +98,131 @@ class Document(models.Model):
         return self.status == 'validated'
 
 
+class CaseBalanceSummary(models.Model):
+    # Totaux pré-agrégés des Documents, maintenus par payments.summaries
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    case = models.ForeignKey('Case', on_delete=models.CASCADE, related_name='balance_summaries')
+    parent = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='balance_summaries')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='balance_summaries')
+    year = models.PositiveSmallIntegerField()
+    quarter = models.PositiveSmallIntegerField()
+    status = models.CharField(max_length=20, choices=Document.STATUS_CHOICES)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('case', 'parent', 'category', 'year', 'quarter', 'status'),)
+
+    def __str__(self):
+        return f"{self.case_id} - {self.parent_id} - {self.year}Q{self.quarter} {self.status}: {self.total}"
+
+
+def parent_pair_key(parent_ids):
+    # Clé indépendante de l'ordre des parents ; None tant que le dossier n'a pas deux parents distincts
+    parent_ids = sorted({str(parent_id) for parent_id in parent_ids if parent_id is not None})
+    if len(parent_ids) != 2:
+        return None
+    return ':'.join(parent_ids)
+
+
+def normalize_search(value):
+    # Minuscules sans accents, pour chercher « Lefevre » dans « Lefèvre »
+    value = unicodedata.normalize('NFKD', value)
+    return ''.join(char for char in value if not unicodedata.combining(char)).lower()
+
+
+def parent_display_fields(parents):
+    # display_name et search_name d'un dossier à partir des (prénom, nom, e-mail) de ses parents
+    parents = list(parents)
+    names = [f"{first_name} {last_name}".strip() or email for first_name, last_name, email in parents]
+    terms = [value for parent in parents for value in parent if value]
+    return {
+        'display_name': ' and '.join(names)[:255],
+        'search_name': normalize_search(' '.join(terms)),
+    }
+
+
+class CaseQuerySet(models.QuerySet):
+    def with_parents(self):
+        # Import différé : accounts.models importe déjà payments.models
+        from accounts.models import ParentCase
+        return self.prefetch_related(
+            Prefetch('parent_cases', queryset=ParentCase.objects.select_related('parent').order_by('id'))
+        )
+
+    def update_parent_fields(self):
+        """
+        Recalcule les champs dérivés des parents (parent_pair_key, display_name, search_name)
+        des dossiers sélectionnés ; retourne le nombre de dossiers modifiés.
+        """
+        from accounts.models import ParentCase
+        parents = {}
+        rows = ParentCase.objects.filter(case__in=self).order_by('case_id', 'id').values_list(
+            'case_id', 'parent_id', 'parent__first_name', 'parent__last_name', 'parent__email'
+        )
+        for case_id, *parent in rows.iterator():
+            parents.setdefault(case_id, []).append(parent)
+
+        changed = []
+        for case in self.only('id', 'parent_pair_key', 'display_name', 'search_name').iterator():
+            case_parents = parents.get(case.id, ())
+            values = {
+                'parent_pair_key': parent_pair_key(parent_id for parent_id, *names in case_parents),
+                **parent_display_fields(names for parent_id, *names in case_parents),
+            }
+            if any(getattr(case, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(case, field, value)
+                changed.append(case)
+        self.model.objects.bulk_update(changed, ['parent_pair_key', 'display_name', 'search_name'], batch_size=1000)
+        return len(changed)
+
+
 class Case(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     draft = models.BooleanField(default=False)
+    # Incrémenté à chaque changement des Documents du dossier (voir payments.summaries)
+    ledger_version = models.PositiveIntegerField(default=0, editable=False)
+    # Identifiants des deux parents triés (voir parent_pair_key) ; comme les noms ci-dessous, tenu à jour par payments.signals
+    parent_pair_key = models.CharField(max_length=73, null=True, blank=True, editable=False)
+    # Noms des parents recopiés pour les listes et menus déroulants, sans charger les parents
+    display_name = models.CharField(max_length=255, blank=True, editable=False)
+    search_name = models.TextField(blank=True, editable=False)
+
+    objects = CaseQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Un seul dossier actif par couple de parents, garanti par la base même en cas de création simultanée
+            models.UniqueConstraint(fields=['parent_pair_key'], condition=Q(draft=False), name='case_unique_parent_pair'),
+        ]
 
     def __str__(self):
+        name = self.display_name or self.get_parents_display()
         if self.draft:
-            return f"Draft Case: {self.get_parents_display()}"
-        return f"Case: {self.get_parents_display()}"
+            return f"Draft Case: {name}"
+        return f"Case: {name}"
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.clear_parents_cache()
+
+    @cached_property
+    def ordered_parent_cases(self):
+        # Déjà chargé si le dossier vient de Case.objects.with_parents()
+        if 'parent_cases' in getattr(self, '_prefetched_objects_cache', {}):
+            return tuple(self.parent_cases.all())
+        return tuple(self.parent_cases.select_related('parent').order_by('id'))
+
+    def clear_parents_cache(self):
+        self.__dict__.pop('ordered_parent_cases', None)
+        getattr(self, '_prefetched_objects_cache', {}).pop('parent_cases', None)
+
+    @property
+    def parents(self):
+        return tuple(parent_case.parent for parent_case in self.ordered_parent_cases)
 
     @property
     def parent1(self):
@@ -89,14 +233,13 @@ class Case(models.Model):
         return self.get_parent_by_index(1)
 
     def get_parent_by_index(self, index):
-        parents = self.parent_cases.all().order_by('id')
+        parents = self.parents
         if index < len(parents):
-            return parents[index].parent
+            return parents[index]
         return None
 
     def get_parents_display(self):
-        parents = self.parent_cases.all().order_by('id')
-        return " and ".join([str(parent_case.parent) for parent_case in parents])
+        return " and ".join([str(parent) for parent in self.parents])
 
     @property
     def number_of_children(self):
@@ -104,7 +247,9 @@ class Case(models.Model):
 
     @property
     def latest_index_history(self):
-        return IndexHistory.objects.filter(case=self).order_by('-year', '-created_at').first()
+        # L'indexation est commune à tous les dossiers ; import différé, payments.indexation importe ce module
+        from .indexation import get_current_index
+        return get_current_index()
 
 
 class Child(models.Model):
@@ -126,4 +271,21 @@ class IndexHistory(models.Model):
     amount = models.DecimalField(max_digits=6, decimal_places=2)
 
     def __str__(self):
-        return f"Indexation {self.indices}% for {self.year}"
\ No newline at end of file
+        return f"Indexation {self.indices}% for {self.year}"
+
+
+class ClosedPeriod(models.Model):
+    # Trimestre clôturé d'un dossier : ses totaux par catégorie et par parent sont figés dans `snapshot`
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    case = models.ForeignKey('Case', on_delete=models.CASCADE, related_name='closed_periods')
+    year = models.IntegerField()
+    quarter = models.PositiveSmallIntegerField()
+    snapshot = models.JSONField(encoder=DjangoJSONEncoder)
+    closed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    closed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (('case', 'year', 'quarter'),)
+
+    def __str__(self):
+        return f"{self.case} - {self.year} Q{self.quarter} (closed)"
@@ -0,0 +1,63 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from datetime import date
+
+
+def quarter_of(value):
+    return (value.month - 1) // 3 + 1
+
+
+def parse_period(year, quarter):
+    try:
+        year, quarter = int(year), int(quarter)
+    except (TypeError, ValueError):
+        return None, None
+    # period_range calcule le 1er janvier de l'année suivante : 9999 dépasserait date.max
+    if not 1 <= year <= 9998 or not 1 <= quarter <= 4:
+        return None, None
+    return year, quarter
+
+
+def quarter_range(year, quarter):
+    """Bornes [début, fin[ du trimestre."""
+    if not 1 <= quarter <= 4:
+        raise ValueError("Invalid quarter value. Must be between 1 and 4.")
+    start = date(year, (quarter - 1) * 3 + 1, 1)
+    end = date(year + 1, 1, 1) if quarter == 4 else date(year, quarter * 3 + 1, 1)
+    return start, end
+
+
+def period_range(year, quarter=None):
+    """Bornes [début, fin[ du trimestre, ou de l'année entière si `quarter` est None."""
+    if quarter is None:
+        return date(year, 1, 1), date(year + 1, 1, 1)
+    return quarter_range(year, quarter)
+
+
+def period_filter(year=None, quarter=None, field='date'):
+    """
+    Filtre sur `field` pour la période, sous forme d'intervalle de dates : contrairement
+    à date__year/date__quarter, il peut utiliser les index contenant la date.
+    """
+    if year is None:
+        return {}
+    start, end = period_range(year, quarter)
+    return {f'{field}__gte': start, f'{field}__lt': end}
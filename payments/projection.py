@@ -0,0 +1,173 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import math
+from datetime import date
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from .balance import BASIS_POINTS, from_cents, load_parent_shares, round_half_up_div, to_cents
+from .indexation import get_current_index
+from .models import Child
+
+PROJECTION_MAX_YEARS = 30
+PROJECTION_MAX_SCENARIOS = 20
+# Les montants sont calculés en cents sur des int64 : 100 % par an pendant 30 ans reste loin de leur limite
+PROJECTION_MAX_RATE = 100
+PROJECTION_MAX_AGE = 99
+
+
+def projection_months(start, years):
+    """Mois simulés à partir du mois de `start`, sous forme de tableau datetime64[M]."""
+    return np.datetime64(start, 'M') + np.arange(years * 12)
+
+
+def project_amounts(base_cents, base_year, months, rates):
+    """
+    Montant mensuel par enfant (cents), par scénario et par mois (scénarios × mois) : le montant
+    de l'indexation `base_year` augmenté de `rate` % chaque 1er janvier qui suit.
+    """
+    offsets = months.astype('datetime64[Y]').astype(np.int64) + 1970 - base_year
+    factors = (1 + np.asarray(rates, dtype=np.float64)[:, np.newaxis] / 100) ** np.maximum(offsets, 0)[np.newaxis, :]
+    return np.floor(base_cents * factors + 0.5).astype(np.int64)
+
+
+def children_per_month(case_rows, birth_months, case_count, months, until_age=None):
+    """
+    Nombre d'enfants à charge de chaque dossier pour chaque mois (dossiers × mois) : un enfant compte
+    à partir de son mois de naissance et, si `until_age` est donné, jusqu'au mois de cet anniversaire exclu.
+    """
+    counts = np.zeros((case_count, len(months) + 1), dtype=np.int64)
+    np.add.at(counts, (case_rows, np.searchsorted(months, birth_months)), 1)
+    if until_age is not None:
+        ends = np.searchsorted(months, birth_months + np.timedelta64(until_age * 12, 'M'))
+        np.add.at(counts, (case_rows, ends), -1)
+    return counts.cumsum(axis=1)[:, :-1]
+
+
+def project_contributions(case_ids=None, years=None, rates=None, until_age=None, start=None):
+    """
+    Contributions futures de chaque dossier pour plusieurs scénarios d'indexation à la fois.
+
+    Le modèle est un tableau scénarios × mois × dossiers (montant par enfant × enfants à charge) ;
+    il n'est jamais construit en entier : les totaux sont obtenus par produit matriciel des
+    montants (scénarios × mois) et des enfants à charge (mois × dossiers).
+    """
+    years = years or settings.PROJECTION_DEFAULT_YEARS
+    rates = list(settings.PROJECTION_DEFAULT_RATES if rates is None else rates)
+    # Même âge limite que la contribution accumulée (payments.accrual), sauf s'il est donné explicitement
+    until_age = settings.CONTRIBUTION_UNTIL_AGE if until_age is None else until_age
+    start = start or date.today()
+    months = projection_months(start, years)
+
+    case_index, slots, shares = load_parent_shares(case_ids)
+    children = list(Child.objects.filter(case_id__in=list(case_index)).values_list('case_id', 'birth_date'))
+    counts = children_per_month(
+        np.array([case_index[case_id] for case_id, birth_date in children], dtype=np.int64),
+        np.array([birth_date for case_id, birth_date in children], dtype='datetime64[M]'),
+        len(case_index), months, until_age,
+    )
+
+    # Sans indexation enregistrée, il n'y a pas de montant de référence : tout est projeté à 0
+    index = get_current_index()
+    base_cents = to_cents(index.amount) if index else 0
+    amounts = project_amounts(base_cents, index.year if index else start.year, months, rates)
+
+    totals = amounts @ counts.T
+    parent1 = round_half_up_div(totals * shares[:, 0], BASIS_POINTS)
+    parent2 = np.where(
+        shares[:, 0] + shares[:, 1] == BASIS_POINTS,
+        totals - parent1,
+        round_half_up_div(totals * shares[:, 1], BASIS_POINTS),
+    )
+    return {
+        'case_ids': list(case_index),
+        'months': months,
+        'rates': rates,
+        'base_amount': from_cents(base_cents),
+        'monthly': amounts * counts.sum(axis=0),
+        'total': totals,
+        'parent1': parent1,
+        'parent2': parent2,
+    }
+
+
+def check_projection_options(years=None, rates=None, until_age=None):
+    """Lève ValidationError si l'horizon, les taux ou l'âge limite ne peuvent pas être simulés."""
+    if years is not None and not 1 <= years <= PROJECTION_MAX_YEARS:
+        raise ValidationError(f'years must be between 1 and {PROJECTION_MAX_YEARS}.')
+    if rates is not None:
+        if not 1 <= len(rates) <= PROJECTION_MAX_SCENARIOS:
+            raise ValidationError(f'Between 1 and {PROJECTION_MAX_SCENARIOS} rates are expected.')
+        # math.isfinite écarte inf et nan, qui passent float()
+        if not all(math.isfinite(rate) and -100 < rate <= PROJECTION_MAX_RATE for rate in rates):
+            raise ValidationError(f'Rates must be numbers above -100 and up to {PROJECTION_MAX_RATE}.')
+    if until_age is not None and not 1 <= until_age <= PROJECTION_MAX_AGE:
+        raise ValidationError(f'until_age must be between 1 and {PROJECTION_MAX_AGE}.')
+
+
+def parse_projection_options(params):
+    """
+    Années, scénarios (taux séparés par des virgules) et âge limite lus dans une requête ;
+    ValueError si une valeur n'est pas un nombre, ValidationError si elle est hors limites.
+    """
+    years = int(params.get('years') or settings.PROJECTION_DEFAULT_YEARS)
+    rates = params.get('rates')
+    rates = [float(rate) for rate in rates.split(',') if rate.strip()] if rates else None
+    until_age = int(params['until_age']) if params.get('until_age') else None
+    check_projection_options(years, rates, until_age)
+    return {'years': years, 'rates': rates, 'until_age': until_age}
+
+
+def projection_summary(result, per_case=False):
+    """Totaux par scénario (et par année), prêts pour une réponse JSON."""
+    years = result['months'].astype('datetime64[Y]').astype(np.int64) + 1970
+    year_list = sorted(set(years.tolist()))
+    scenarios = []
+    for row, rate in enumerate(result['rates']):
+        yearly = np.zeros(len(year_list), dtype=np.int64)
+        np.add.at(yearly, np.searchsorted(year_list, years), result['monthly'][row])
+        scenario = {
+            'rate': rate,
+            'total': str(from_cents(result['total'][row].sum())),
+            'parent1': str(from_cents(result['parent1'][row].sum())),
+            'parent2': str(from_cents(result['parent2'][row].sum())),
+            'yearly': {year: str(from_cents(amount)) for year, amount in zip(year_list, yearly)},
+        }
+        if per_case:
+            scenario['cases'] = [
+                {
+                    'case': str(case_id),
+                    'total': str(from_cents(result['total'][row][column])),
+                    'parent1': str(from_cents(result['parent1'][row][column])),
+                    'parent2': str(from_cents(result['parent2'][row][column])),
+                }
+                for column, case_id in enumerate(result['case_ids'])
+            ]
+        scenarios.append(scenario)
+    return {
+        'base_amount': str(result['base_amount']),
+        'start': str(result['months'][0]) if len(result['months']) else None,
+        'months': len(result['months']),
+        'cases': len(result['case_ids']),
+        'scenarios': scenarios,
+    }
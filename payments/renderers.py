@@ -0,0 +1,154 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.template.loader import render_to_string
+from django.utils.formats import localize
+from django.utils.html import escape
+from django.utils.translation import gettext as _
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from xhtml2pdf import pisa
+
+
+class StatementError(Exception):
+    pass
+
+
+class StatementRenderer:
+    """Transforme le contexte de build_payment_history_context en PDF."""
+    name = None
+
+    def render(self, context):
+        raise NotImplementedError
+
+
+class XhtmlStatementRenderer(StatementRenderer):
+    # Rendu historique : gabarit HTML converti par xhtml2pdf
+    name = 'xhtml2pdf'
+    template_name = 'payments/pdf_template.html'
+
+    def render(self, context):
+        html_string = render_to_string(self.template_name, context)
+        output = BytesIO()
+        pisa_status = pisa.CreatePDF(html_string, dest=output)
+        if pisa_status.err:
+            raise StatementError(f'xhtml2pdf reported {pisa_status.err} error(s) for case {context["case"].pk}')
+        return output.getvalue()
+
+
+def full_name(user):
+    if user is None:
+        return ''
+    return f"{user.first_name} {user.last_name}"
+
+
+def amount_cell(amount, pending):
+    text = f"{localize(amount)} €"
+    if pending > 0:
+        text += f" ({localize(pending)} € en attente)"
+    return text
+
+
+class ReportLabStatementRenderer(StatementRenderer):
+    # Tableaux platypus construits directement, sans passer par le HTML
+    name = 'reportlab'
+    table_style = TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#dddddd')),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f2f2f2')),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('PADDING', (0, 0), (-1, -1), 6),
+    ])
+
+    def render(self, context):
+        styles = getSampleStyleSheet()
+        parent1_name = full_name(context['parent1_user'])
+        parent2_name = full_name(context['parent2_user'])
+
+        story = [Paragraph(escape(_("Récapitulatif des paiements")), styles['Heading2'])]
+        if context.get('selected_quarter'):
+            period = f"{_('Année')}: {context['selected_year']}, {_('Trimestre')}: Trimestre {context['selected_quarter']}"
+        else:
+            period = f"{_('date ')}: {context['selected_year']}"
+        story.append(Paragraph(escape(period), styles['Normal']))
+
+        column_widths = [7 * cm, 5 * cm, 5 * cm]
+        for type_data in context['categories_by_type'].values():
+            story.append(Paragraph(escape(type_data['type_name']), styles['Heading3']))
+            rows = [[_("Catégorie"), parent1_name, parent2_name]]
+            for entry in type_data['categories']:
+                rows.append([
+                    entry['category_name'],
+                    amount_cell(entry['parent1_amount'], entry['parent1_pending_amount']),
+                    amount_cell(entry['parent2_amount'], entry['parent2_pending_amount']),
+                ])
+            table = Table(rows, colWidths=column_widths, repeatRows=1)
+            table.setStyle(self.table_style)
+            story.append(table)
+            story.append(Spacer(1, 0.5 * cm))
+
+        if context['difference'] != 0:
+            balance = f"{localize(context['difference'])} € {_('en faveur de')} {full_name(context['in_favor_of'])}."
+        else:
+            balance = f"{_('Montant équilibré')}."
+        story.append(Paragraph(escape(_("Résumé de la balance")), styles['Heading2']))
+        summary = Table([
+            [f"{_('Total pour')} {parent1_name}", f"{localize(context['parent1_total'])} €"],
+            [f"{_('Total pour')} {parent2_name}", f"{localize(context['parent2_total'])} €"],
+            [_("Balance"), balance],
+        ], colWidths=[7 * cm, 10 * cm])
+        summary.setStyle(self.table_style)
+        story.append(summary)
+
+        if context.get('accrued_months'):
+            story.append(Paragraph(
+                escape(f"{_('Contribution alimentaire accumulée')} ({context['accrued_months']} {_('mois')})"), styles['Heading2']
+            ))
+            accrual = Table([
+                ['', _("Dû"), _("Payé")],
+                [parent1_name, f"{localize(context['parent1_accrued'])} €", f"{localize(context['parent1_total'])} €"],
+                [parent2_name, f"{localize(context['parent2_accrued'])} €", f"{localize(context['parent2_total'])} €"],
+            ], colWidths=column_widths)
+            accrual.setStyle(self.table_style)
+            story.append(accrual)
+
+        output = BytesIO()
+        SimpleDocTemplate(output, pagesize=A4, title=_("Récapitulatif des paiements")).build(story)
+        return output.getvalue()
+
+
+STATEMENT_RENDERERS = {
+    renderer.name: renderer for renderer in (XhtmlStatementRenderer, ReportLabStatementRenderer)
+}
+
+
+def get_statement_renderer(name=None):
+    name = name or getattr(settings, 'STATEMENT_RENDERER', XhtmlStatementRenderer.name)
+    try:
+        return STATEMENT_RENDERERS[name]()
+    except KeyError:
+        raise ImproperlyConfigured(f"Unknown STATEMENT_RENDERER '{name}', expected one of {', '.join(STATEMENT_RENDERERS)}.")
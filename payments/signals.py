@@ -18,10 +18,15 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_migrate, pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
 
-from .models import Category, CategoryType
+from accounts.models import ParentCase, User
+from .caches import category_catalogue
+from .closing import check_period_open, get_closed_quarters
+from .indexation import index_table
+from .models import Case, Category, CategoryType, Child, Document, IndexHistory
+from .summaries import bump_ledger_version, document_entry, record_document_change
 
 TYPE_MAPPING = {
     1: "Médicale",
@@ -93,3 +98,97 @@ def create_default_payment_categories(sender, **kwargs):
                     type_id=category_type.id,  # .id pour régler TypeError
                     defaults={"description": category_data["description"]}
                 )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=CategoryType)
+@receiver(post_delete, sender=CategoryType)
+def invalidate_category_catalogue(sender, **kwargs):
+    category_catalogue.invalidate()
+
+
+@receiver(post_save, sender=IndexHistory)
+@receiver(post_delete, sender=IndexHistory)
+def invalidate_index_table(sender, **kwargs):
+    index_table.invalidate()
+
+
+@receiver(pre_save, sender=Document)
+def prepare_document_save(sender, instance, raw=False, **kwargs):
+    """
+    Lit une seule fois la version enregistrée du Document : son ancien trimestre ne doit pas
+    être clôturé, et son entrée de résumé est gardée pour update_balance_summary_on_save.
+    """
+    instance._previous_balance_entry = None
+    if raw:
+        return
+    # Dernier rempart : les vues et l'import signalent déjà ces erreurs, mais une écriture directe est aussi refusée
+    closed_quarters = {}
+    if instance.case_id is not None:
+        closed_quarters[instance.case_id] = get_closed_quarters(instance.case_id)
+        check_period_open(instance.date, closed_quarters[instance.case_id])
+    if instance._state.adding:
+        return
+    previous = Document.objects.filter(pk=instance.pk).only(
+        'case_id', 'user_id', 'category_id', 'date', 'status', 'amount'
+    ).first()
+    if previous is None:
+        return
+    if previous.case_id is not None:
+        if previous.case_id not in closed_quarters:
+            closed_quarters[previous.case_id] = get_closed_quarters(previous.case_id)
+        check_period_open(previous.date, closed_quarters[previous.case_id])
+    instance._previous_balance_entry = document_entry(previous)
+
+
+@receiver(pre_delete, sender=Document)
+def protect_closed_periods_on_delete(sender, instance, origin=None, **kwargs):
+    # La suppression d'un dossier, d'un parent ou d'une catégorie emporte ses paiements, même clôturés :
+    # les totaux des trimestres clôturés restent dans l'instantané de leur ClosedPeriod
+    if isinstance(origin, (Case, User, Category, CategoryType)) or instance.case_id is None:
+        return
+    check_period_open(instance.date, get_closed_quarters(instance.case_id))
+
+
+@receiver(post_save, sender=Document)
+def update_balance_summary_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_balance_entry', None)
+    record_document_change(previous, document_entry(instance))
+    instance._previous_balance_entry = document_entry(instance)
+
+
+@receiver(post_delete, sender=Document)
+def update_balance_summary_on_delete(sender, instance, **kwargs):
+    record_document_change(document_entry(instance), None)
+
+
+@receiver(post_save, sender=ParentCase)
+@receiver(post_delete, sender=ParentCase)
+def update_case_parent_fields(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    Case.objects.filter(pk=instance.case_id).update_parent_fields()
+    # Les pourcentages changent les parts dues : relevés et contributions accumulées sont à refaire
+    bump_ledger_version([instance.case_id])
+
+
+@receiver(post_save, sender=Child)
+@receiver(post_delete, sender=Child)
+def bump_ledger_version_on_child_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    bump_ledger_version([instance.case_id])
+
+
+PARENT_NAME_FIELDS = {'first_name', 'last_name', 'email'}
+
+
+@receiver(post_save, sender=User)
+def update_parent_names(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Ignore les sauvegardes partielles sans rapport, comme la mise à jour de last_login
+    if raw or created or instance.role != 'parent' or (update_fields and not PARENT_NAME_FIELDS & set(update_fields)):
+        return
+    Case.objects.filter(parent_cases__parent=instance).update_parent_fields()
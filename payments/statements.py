@@ -0,0 +1,198 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import glob
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.utils import timezone
+
+from .indexation import index_table
+from .ledger import build_payment_history_context
+from .models import Case
+from .renderers import get_statement_renderer
+
+logger = logging.getLogger(__name__)
+
+# Au-delà, le verrou d'un relevé est considéré comme abandonné par un processus arrêté pendant le rendu
+STATEMENT_LOCK_TIMEOUT = 600
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def statement_period(year=None, quarter=None):
+    # Année et trimestre affichés : sans année, le relevé couvre tout le dossier mais affiche l'année en cours
+    if year is None:
+        return timezone.now().year, None
+    return year, quarter
+
+
+def statement_filename(year, quarter):
+    if quarter is None:
+        return f'PaymentHistory_{year}.pdf'
+    return f'PaymentHistory_{year}_Q{quarter}.pdf'
+
+
+def statement_path(case, year, quarter):
+    if year is None:
+        period = 'all'
+    else:
+        period = f'{year}_Q{quarter}' if quarter else str(year)
+    # Le nom du moteur évite de resservir un fichier produit par l'autre moteur après un changement de réglage
+    renderer = get_statement_renderer().name
+    # Une nouvelle indexation change la contribution accumulée de tous les dossiers
+    version = f'{case.ledger_version}.{index_table.get_version()}'
+    return os.path.join(settings.STATEMENT_ROOT, str(case.pk), f'{period}_{renderer}_v{version}.pdf')
+
+
+def render_statement(case, year=None, quarter=None):
+    context = build_payment_history_context(case, year, quarter)
+    context['selected_year'], context['selected_quarter'] = statement_period(year, quarter)
+
+    return get_statement_renderer().render(context)
+
+
+def write_statement(case, year, quarter, path):
+    data = render_statement(case, year, quarter)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as output:
+        output.write(data)
+    os.replace(temporary_path, path)
+
+    # Les versions précédentes du même relevé ne seront plus servies
+    prefix = os.path.basename(path).rsplit('_v', 1)[0]
+    for stale in glob.glob(os.path.join(os.path.dirname(path), f'{prefix}_v*.pdf')):
+        if stale != path:
+            os.remove(stale)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Le rendu PDF tourne dans des processus séparés, pas dans les threads du serveur web
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.STATEMENT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            )
+        return _executor
+
+
+def _acquire_lock(path):
+    """
+    Crée le verrou du relevé à côté de son fichier ; False si un autre processus le rend déjà.
+    Le verrou est un fichier : il est partagé par tous les processus du serveur web.
+    """
+    lock_path = f'{path}.lock'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        pass
+    try:
+        if time.time() - os.path.getmtime(lock_path) < STATEMENT_LOCK_TIMEOUT:
+            return False
+        os.utime(lock_path)
+    except FileNotFoundError:
+        # Le rendu vient de se terminer : le prochain appel trouvera le fichier ou l'échec
+        return False
+    return True
+
+
+def _release_lock(path):
+    try:
+        os.remove(f'{path}.lock')
+    except FileNotFoundError:
+        pass
+
+
+def _render_in_background(case_id, year, quarter, path):
+    try:
+        case = Case.objects.with_parents().get(pk=case_id)
+        write_statement(case, year, quarter, path)
+    except Exception:
+        logger.exception("Statement rendering failed for case %s", case_id)
+        # Le détail de l'erreur reste dans les logs : l'échec est seulement signalé au prochain appel
+        open(f'{path}.failed', 'w').close()
+    finally:
+        _release_lock(path)
+        close_old_connections()
+
+
+def request_statement(case, year=None, quarter=None):
+    """
+    Retourne ('ready', chemin), ('pending', None) ou ('failed', None).
+
+    Le relevé est rendu une seule fois par version du dossier : tant que ses Documents
+    ne changent pas, le fichier déjà produit est resservi.
+    """
+    path = statement_path(case, year, quarter)
+    if os.path.exists(path):
+        return 'ready', path
+    try:
+        os.remove(f'{path}.failed')
+        return 'failed', None
+    except FileNotFoundError:
+        pass
+
+    if not _acquire_lock(path):
+        return 'pending', None
+    try:
+        _get_executor().submit(_render_in_background, case.pk, year, quarter, path)
+    except Exception:
+        _release_lock(path)
+        raise
+    return 'pending', None
+
+
+def init_statement_worker():
+    # Processus d'un lot : avec fork, Django est déjà chargé ; avec spawn, il faut l'initialiser
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def render_statement_file(case_id, year, quarter, directory):
+    """
+    Rend le relevé d'un dossier dans `directory` ; exécuté dans un processus de generate_statements.
+    Retourne une ligne de manifeste, avec l'erreur éventuelle plutôt qu'une exception.
+    """
+    started = time.monotonic()
+    filename = f'{case_id}_{statement_filename(year, quarter)}'
+    try:
+        case = Case.objects.with_parents().get(pk=case_id)
+        data = render_statement(case, year, quarter)
+        with open(os.path.join(directory, filename), 'wb') as output:
+            output.write(data)
+    except Exception as e:
+        logger.exception("Statement rendering failed for case %s", case_id)
+        return {'case': str(case_id), 'file': '', 'size': 0, 'seconds': round(time.monotonic() - started, 3), 'error': str(e)}
+    return {'case': str(case_id), 'file': filename, 'size': len(data), 'seconds': round(time.monotonic() - started, 3), 'error': ''}
@@ -0,0 +1,65 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Document
+from .summaries import document_entry, record_document_changes
+
+
+def store_receipts(documents):
+    """
+    Enregistre en parallèle les justificatifs pas encore stockés des `documents` et
+    remplace chaque fichier par son nom dans le stockage. Retourne les noms enregistrés.
+    """
+    field = Document._meta.get_field('document')
+    pending = [document for document in documents if document.document and not document.document._committed]
+
+    def save(document):
+        upload = document.document.file
+        name = field.generate_filename(document, upload.name)
+        return field.storage.save(name, upload, max_length=field.max_length)
+
+    if not pending:
+        return []
+    with ThreadPoolExecutor(max_workers=min(settings.PAYMENT_UPLOAD_WORKERS, len(pending))) as executor:
+        names = list(executor.map(save, pending))
+    for document, name in zip(pending, names):
+        document.document = name
+    return names
+
+
+def create_payment_documents(case, documents):
+    """Stocke les justificatifs puis insère tous les Documents du dossier en une transaction."""
+    names = store_receipts(documents)
+    try:
+        with transaction.atomic():
+            created = Document.objects.bulk_create(documents)
+            # bulk_create n'envoie pas les signaux qui tiennent CaseBalanceSummary à jour
+            record_document_changes([(None, document_entry(document)) for document in created])
+    except Exception:
+        storage = Document._meta.get_field('document').storage
+        for name in names:
+            storage.delete(name)
+        raise
+    return created
@@ -0,0 +1,140 @@
+"""
+Neok-Budget: A Django-based web application for budgeting.
+Copyright (C) 2024  David Botton, Arnaud Mahieu
+
+Developed for Jurinet and its branch Neok-Budget.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum, Count, F
+from django.db.models.functions import ExtractQuarter, ExtractYear
+
+from .models import Case, CaseBalanceSummary, Document
+from .periods import quarter_of
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def document_entry(document):
+    """Clé de CaseBalanceSummary et montant d'un Document, ou None s'il n'est lié à aucun dossier."""
+    if document.case_id is None or document.user_id is None or document.category_id is None:
+        return None
+    document_date = document.date
+    if isinstance(document_date, str):
+        document_date = date.fromisoformat(document_date)
+    key = (
+        document.case_id,
+        document.user_id,
+        document.category_id,
+        document_date.year,
+        quarter_of(document_date),
+        document.status,
+    )
+    # Comme la date, le montant peut encore être une chaîne si le Document n'a pas été relu depuis sa création
+    return key, Decimal(str(document.amount))
+
+
+def apply_delta(key, amount, count):
+    case_id, parent_id, category_id, year, quarter, status = key
+    lookup = {
+        'case_id': case_id,
+        'parent_id': parent_id,
+        'category_id': category_id,
+        'year': year,
+        'quarter': quarter,
+        'status': status,
+    }
+    # Une soustraction ne crée jamais de ligne : pendant la suppression en cascade
+    # d'un dossier, ses résumés peuvent déjà avoir disparu.
+    if count > 0:
+        CaseBalanceSummary.objects.get_or_create(**lookup)
+    CaseBalanceSummary.objects.filter(**lookup).update(total=F('total') + amount, count=F('count') + count)
+    if count < 0:
+        CaseBalanceSummary.objects.filter(count__lte=0, **lookup).delete()
+
+
+def bump_ledger_version(case_ids):
+    Case.objects.filter(pk__in=case_ids).update(ledger_version=F('ledger_version') + 1)
+
+
+def record_document_change(previous, current):
+    """Reporte dans les résumés le passage d'un Document de `previous` à `current` (entrées de document_entry)."""
+    record_document_changes([(previous, current)])
+
+
+def record_document_changes(changes):
+    """
+    Reporte un lot de changements (previous, current) : les écarts sont regroupés par clé,
+    pour une mise à jour par ligne de résumé touchée plutôt que par Document.
+    """
+    deltas = {}
+    for previous, current in changes:
+        if previous == current:
+            continue
+        for entry, sign in ((previous, -1), (current, 1)):
+            if entry is None:
+                continue
+            key, amount = entry
+            total, count = deltas.get(key, (0, 0))
+            deltas[key] = (total + sign * amount, count + sign)
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    with transaction.atomic():
+        for key, (amount, count) in deltas.items():
+            apply_delta(key, amount, count)
+        bump_ledger_version({key[0] for key in deltas})
+
+
+@transaction.atomic
+def rebuild_case_balances(case_ids=None):
+    """Recalcule entièrement les résumés, pour tous les dossiers ou seulement ceux de `case_ids`."""
+    documents = Document.objects.filter(case__isnull=False)
+    summaries = CaseBalanceSummary.objects.all()
+    if case_ids is not None:
+        case_ids = list(case_ids)
+        documents = documents.filter(case_id__in=case_ids)
+        summaries = summaries.filter(case_id__in=case_ids)
+
+    rows = documents.annotate(
+        year=ExtractYear('date'),
+        quarter=ExtractQuarter('date'),
+    ).values('case', 'user', 'category', 'year', 'quarter', 'status').annotate(
+        total=Sum('amount'),
+        count=Count('id'),
+    ).order_by()
+
+    summaries.delete()
+    if case_ids is None:
+        Case.objects.update(ledger_version=F('ledger_version') + 1)
+    else:
+        bump_ledger_version(case_ids)
+    created = CaseBalanceSummary.objects.bulk_create((
+        CaseBalanceSummary(
+            case_id=row['case'],
+            parent_id=row['user'],
+            category_id=row['category'],
+            year=row['year'],
+            quarter=row['quarter'],
+            status=row['status'],
+            total=row['total'],
+            count=row['count'],
+        ) for row in rows.iterator()
+    ), batch_size=REBUILD_BATCH_SIZE)
+    return len(created)
@@ -0,0 +1,33 @@
+from datetime import date
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from payments.accrual import accrual_bounds, accrue, month_range
+
+
+class AccrueTest(SimpleTestCase):
+    def test_children_count_from_their_birth_month(self):
+        months = month_range(date(2023, 11, 1), date(2024, 3, 1))
+        monthly = accrue(months, [date(2020, 5, 3), date(2024, 1, 20)], [2023, 2024], [15000, 15600])
+        self.assertEqual(list(monthly), [15000, 15000, 31200, 31200])
+
+    def test_children_stop_counting_from_the_age_limit(self):
+        # Le premier enfant a 18 ans en février 2024 : il ne compte plus à partir de ce mois
+        months = month_range(date(2023, 12, 1), date(2024, 4, 1))
+        monthly = accrue(months, [date(2006, 2, 10), date(2010, 1, 1)], [2023], [10000], until_age=18)
+        self.assertEqual(list(monthly), [20000, 20000, 10000, 10000])
+
+    def test_months_before_the_first_indexation_accrue_nothing(self):
+        months = month_range(date(2021, 12, 1), date(2022, 2, 1))
+        self.assertEqual(list(accrue(months, [date(2020, 1, 1)], [2022], [10000])), [0, 10000])
+        self.assertEqual(list(accrue(months, [date(2020, 1, 1)], [], [])), [0, 0])
+
+    def test_bounds_stop_at_the_current_month(self):
+        until = date(2024, 5, 1)
+        self.assertEqual(accrual_bounds([date(2019, 6, 1)], 2020, 2024, None, until), (date(2024, 1, 1), until))
+        self.assertEqual(accrual_bounds([date(2019, 6, 1)], 2020, None, None, until), (date(2020, 1, 1), until))
+        self.assertEqual(accrual_bounds([date(2021, 6, 1)], 2020, 2024, 4, until), None)
+        self.assertIsNone(accrual_bounds([], 2020, None, None, until))
+        self.assertEqual(len(month_range(date(2024, 1, 1), until)), 4)
+        self.assertEqual(month_range(date(2024, 1, 1), until).dtype, np.dtype('datetime64[M]'))
@@ -0,0 +1,27 @@
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from payments.balance import settle, settle_case
+
+
+class SettleTest(SimpleTestCase):
+    def test_equal_shares(self):
+        balance = settle_case(Decimal('100.00'), Decimal('40.00'), 50, 50)
+        self.assertEqual(balance['parent1_due'], Decimal('70.00'))
+        self.assertEqual(balance['parent2_due'], Decimal('70.00'))
+        self.assertEqual(balance['net'], Decimal('30.00'))
+
+    def test_shares_always_add_up_to_the_total(self):
+        balance = settle_case(Decimal('0.01'), Decimal('0.00'), 50, 50)
+        self.assertEqual(balance['parent1_due'] + balance['parent2_due'], Decimal('0.01'))
+
+    def test_weighted_shares_round_half_up(self):
+        # 33,33 % de 1,00 € = 0,3333 € -> 0,33 € ; 33,35 % -> 0,3335 € -> 0,33 €, 33,5 % -> 0,335 € -> 0,34 €
+        result = settle([100, 100, 100], [0, 0, 0], [3333, 3335, 3350], [6667, 6665, 6650])
+        self.assertEqual(list(result['parent1_due']), [33, 33, 34])
+        self.assertEqual(list(result['parent2_due']), [67, 67, 66])
+
+    def test_net_is_owed_to_parent2(self):
+        balance = settle_case(Decimal('0.00'), Decimal('90.00'), 60, 40)
+        self.assertEqual(balance['net'], Decimal('-54.00'))
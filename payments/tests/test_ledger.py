@@ -0,0 +1,75 @@
+from datetime import date
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from payments.ledger import build_ledger
+from payments.periods import parse_period, period_filter, quarter_range
+
+
+def ledger_row(category, year, quarter, **amounts):
+    row = {
+        'category__type': 'type-%s' % category[0],
+        'category__type__name': 'Type %s' % category[0],
+        'category': category,
+        'category__name': 'Category %s' % category,
+        'year': year,
+        'quarter': quarter,
+    }
+    row.update(amounts)
+    return row
+
+
+class BuildLedgerTest(SimpleTestCase):
+    def setUp(self):
+        self.rows = [
+            ledger_row('a1', 2023, 1, parent1_amount=Decimal('10.00'), parent2_amount=Decimal('5.00')),
+            ledger_row('a1', 2024, 2, parent1_amount=Decimal('7.50'), parent2_pending_amount=Decimal('3.00')),
+            ledger_row('b1', 2024, 2, parent2_amount=Decimal('20.00')),
+            ledger_row('b2', 2024, 3),
+        ]
+
+    def test_totals_over_all_periods(self):
+        ledger = build_ledger(self.rows)
+        self.assertEqual(ledger['parent1_total'], Decimal('17.50'))
+        self.assertEqual(ledger['parent2_total'], Decimal('25.00'))
+        self.assertEqual(ledger['category_ids'], ['a1', 'b1'])
+        entry = ledger['categories_by_type']['type-a']['categories'][0]
+        self.assertEqual(entry['parent1_amount'], Decimal('17.50'))
+        self.assertEqual(entry['parent2_pending_amount'], Decimal('3.00'))
+
+    def test_period_filter_keeps_active_quarters(self):
+        ledger = build_ledger(self.rows, 2024, 2)
+        self.assertEqual(ledger['parent1_total'], Decimal('7.50'))
+        self.assertEqual(ledger['parent2_total'], Decimal('20.00'))
+        self.assertEqual(ledger['years'], [2023, 2024])
+        self.assertEqual(ledger['active_quarters_per_year'], {2023: {1}, 2024: {2, 3}})
+
+    def test_year_filter_without_quarter(self):
+        ledger = build_ledger(self.rows, 2023)
+        self.assertEqual(ledger['parent1_total'], Decimal('10.00'))
+        self.assertEqual(ledger['parent2_total'], Decimal('5.00'))
+        self.assertEqual(ledger['category_ids'], ['a1'])
+
+
+class PeriodTest(SimpleTestCase):
+    def test_quarter_range_is_half_open(self):
+        self.assertEqual(quarter_range(2024, 1), (date(2024, 1, 1), date(2024, 4, 1)))
+        self.assertEqual(quarter_range(2024, 4), (date(2024, 10, 1), date(2025, 1, 1)))
+
+    def test_invalid_quarter(self):
+        with self.assertRaises(ValueError):
+            quarter_range(2024, 5)
+        self.assertEqual(parse_period('2024', '5'), (None, None))
+        self.assertEqual(parse_period('2024', 'x'), (None, None))
+
+    def test_out_of_range_year(self):
+        self.assertEqual(parse_period('0', '1'), (None, None))
+        self.assertEqual(parse_period('9999', '4'), (None, None))
+        self.assertEqual(parse_period('123456', '1'), (None, None))
+        self.assertEqual(parse_period('9998', '4'), (9998, 4))
+
+    def test_period_filter(self):
+        self.assertEqual(period_filter(None, None), {})
+        self.assertEqual(period_filter(2024, 2), {'date__gte': date(2024, 4, 1), 'date__lt': date(2024, 7, 1)})
+        self.assertEqual(period_filter(2024), {'date__gte': date(2024, 1, 1), 'date__lt': date(2025, 1, 1)})
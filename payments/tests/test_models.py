@@ -1,7 +1,18 @@
-from django.test import TestCase
-from payments.models import Child, Case
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from payments.caches import category_catalogue, get_cache_version
+from payments.closing import PeriodClosedError, close_period
+from payments.forms import CombineDraftsForm
+from payments.ledger import get_case_ledger
+from payments.indexation import get_contribution_amount, get_current_index, get_index_for_year, index_table
+from payments.models import CaseBalanceSummary, Child, Case, Category, CategoryType, Document, IndexHistory, parent_pair_key
+from payments.views import review_pending_payments
+from accounts.models import ParentCase
 from django.utils import timezone
 from datetime import date
+from decimal import Decimal
 import uuid
 from django.contrib.auth import get_user_model
 
@@ -34,3 +45,215 @@ class ChildModelTest(TestCase):
 
     def test_str_representation(self):
         self.assertEqual(str(self.child), 'Jean Dupont')
+
+
+class CaseBalanceSummaryTest(TestCase):
+    def setUp(self):
+        self.parent = User.objects.create_user(email='summary-parent@example.com', password='ComplexPassword1!', role='parent')
+        self.case = Case.objects.create()
+        ParentCase.objects.create(case=self.case, parent=self.parent, percentage=50)
+        category_type = CategoryType.objects.create(name='Summary type')
+        self.category = Category.objects.create(name='Summary category', type=category_type)
+
+    def create_document(self, amount, day, status='pending'):
+        return Document.objects.create(user=self.parent, case=self.case, category=self.category, amount=amount, date=day, status=status)
+
+    def test_summary_follows_document_changes(self):
+        first = self.create_document(Decimal('10.00'), date(2024, 2, 1))
+        self.create_document(Decimal('5.00'), date(2024, 3, 1))
+        summary = CaseBalanceSummary.objects.get(case=self.case, status='pending')
+        self.assertEqual((summary.year, summary.quarter, summary.total, summary.count), (2024, 1, Decimal('15.00'), 2))
+
+        first.status = 'validated'
+        first.save()
+        self.assertEqual(CaseBalanceSummary.objects.get(case=self.case, status='pending').total, Decimal('5.00'))
+        self.assertEqual(CaseBalanceSummary.objects.get(case=self.case, status='validated').total, Decimal('10.00'))
+
+        first.delete()
+        self.assertFalse(CaseBalanceSummary.objects.filter(case=self.case, status='validated').exists())
+
+    def test_string_amount_and_date_are_summarized(self):
+        self.create_document('12.50', '2024-02-01')
+        summary = CaseBalanceSummary.objects.get(case=self.case, status='pending')
+        self.assertEqual((summary.quarter, summary.total, summary.count), (1, Decimal('12.50'), 1))
+
+    def test_bulk_review_moves_totals_between_statuses(self):
+        first = self.create_document(Decimal('10.00'), date(2024, 2, 1))
+        second = self.create_document(Decimal('5.00'), date(2024, 3, 1))
+        self.create_document(Decimal('7.00'), date(2024, 3, 2))
+        results = review_pending_payments(self.case, [str(first.pk), str(second.pk)], 'validated')
+        self.assertEqual(set(results.values()), {'validated'})
+        self.assertEqual(CaseBalanceSummary.objects.get(case=self.case, status='pending').total, Decimal('7.00'))
+        validated = CaseBalanceSummary.objects.get(case=self.case, status='validated')
+        self.assertEqual((validated.total, validated.count), (Decimal('15.00'), 2))
+
+
+class CaseParentsCacheTest(TestCase):
+    def setUp(self):
+        for index in range(3):
+            case = Case.objects.create()
+            for parent_index in range(2):
+                parent = User.objects.create_user(email=f'cache{index}-{parent_index}@example.com', password='ComplexPassword1!', role='parent')
+                ParentCase.objects.create(case=case, parent=parent, percentage=50)
+
+    def test_with_parents_resolves_parents_without_extra_queries(self):
+        with self.assertNumQueries(2):
+            cases = list(Case.objects.with_parents())
+            labels = [(str(case), case.parent1, case.parent2) for case in cases]
+        self.assertEqual(len(labels), 3)
+        self.assertTrue(all(parent1 and parent2 for label, parent1, parent2 in labels))
+
+    def test_parents_are_memoized_per_instance(self):
+        case = Case.objects.first()
+        with self.assertNumQueries(1):
+            case.parent1
+            case.parent2
+            case.get_parents_display()
+
+
+class CategoryCatalogueTest(TestCase):
+    def setUp(self):
+        self.catalogue = category_catalogue
+        self.catalogue.clear()
+        self.category_type = CategoryType.objects.create(name='Catalogue')
+
+    @override_settings(CACHE_VERSION_CHECK_INTERVAL=60)
+    def test_catalogue_is_not_reloaded_between_checks(self):
+        self.catalogue.get()
+        with self.assertNumQueries(0):
+            self.catalogue.get()
+
+    @override_settings(CACHE_VERSION_CHECK_INTERVAL=0)
+    def test_new_category_bumps_version(self):
+        before = get_cache_version('categories')
+        category = Category.objects.create(name='Piscine', type=self.category_type)
+        self.assertEqual(get_cache_version('categories'), before + 1)
+        self.assertIn(category, self.catalogue.get()['categories'])
+
+    @override_settings(CACHE_VERSION_CHECK_INTERVAL=0)
+    def test_unchanged_version_checks_without_reloading(self):
+        self.catalogue.get()
+        with self.assertNumQueries(1):
+            self.catalogue.get()
+
+
+class ParentPairKeyTest(TestCase):
+
+    def setUp(self):
+        self.parent1 = User.objects.create_user(email='pair1@example.com', password='ComplexPassword1!', role='parent')
+        self.parent2 = User.objects.create_user(email='pair2@example.com', password='ComplexPassword1!', role='parent')
+        self.case = Case.objects.create(draft=False)
+        ParentCase.objects.create(case=self.case, parent=self.parent1)
+        ParentCase.objects.create(case=self.case, parent=self.parent2)
+
+    def test_key_ignores_parent_order(self):
+        self.case.refresh_from_db()
+        self.assertEqual(self.case.parent_pair_key, parent_pair_key([self.parent2.pk, self.parent1.pk]))
+        self.assertIsNone(parent_pair_key([self.parent1.pk, None]))
+
+    def test_second_active_case_for_the_same_parents_is_rejected(self):
+        other = Case.objects.create(draft=False)
+        ParentCase.objects.create(case=other, parent=self.parent2)
+        with self.assertRaises(IntegrityError):
+            ParentCase.objects.create(case=other, parent=self.parent1)
+
+
+class CaseDisplayNameTest(TestCase):
+
+    def setUp(self):
+        self.parent = User.objects.create_user(email='display@example.com', password='ComplexPassword1!', role='parent',
+                                               first_name='Hélène', last_name='Lefèvre')
+        self.case = Case.objects.create(draft=True)
+        ParentCase.objects.create(case=self.case, parent=self.parent)
+
+    def test_display_name_follows_parent_renames(self):
+        self.case.refresh_from_db()
+        self.assertEqual(self.case.display_name, 'Hélène Lefèvre')
+        self.assertIn('lefevre', self.case.search_name)
+
+        self.parent.last_name = 'Martin'
+        self.parent.save()
+        self.case.refresh_from_db()
+        self.assertEqual(str(self.case), 'Draft Case: Hélène Martin')
+
+    def test_draft_labels_render_without_loading_parents(self):
+        lawyer = User.objects.create_user(email='display-lawyer@example.com', password='ComplexPassword1!', role='lawyer')
+        form = CombineDraftsForm(user=lawyer)
+        with self.assertNumQueries(1):
+            labels = [label for value, label in form.fields['draft1'].choices if value]
+        self.assertEqual(labels, [])
+        with self.assertNumQueries(1):
+            labels = [label for value, label in form.fields['draft2'].choices if value]
+        self.assertTrue(labels[0].startswith('Hélène Lefèvre |'))
+
+
+class IndexTableTest(TestCase):
+    def setUp(self):
+        index_table.clear()
+        IndexHistory.objects.create(year=2022, indices=Decimal('100.00'), amount=Decimal('150.00'))
+        IndexHistory.objects.create(year=2024, indices=Decimal('104.00'), amount=Decimal('156.00'))
+
+    @override_settings(CACHE_VERSION_CHECK_INTERVAL=60)
+    def test_contribution_lookups_take_no_queries(self):
+        get_index_for_year(2024)
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_index_for_year(2021))
+            self.assertEqual(get_index_for_year(2023).year, 2022)
+            self.assertEqual(get_contribution_amount(2, year=2025), Decimal('312.00'))
+            self.assertEqual(get_contribution_amount(1), Decimal('156.00'))
+
+    @override_settings(CACHE_VERSION_CHECK_INTERVAL=0)
+    def test_new_indexation_is_picked_up(self):
+        get_current_index()
+        IndexHistory.objects.create(year=2025, indices=Decimal('106.00'), amount=Decimal('159.00'))
+        self.assertEqual(get_current_index().year, 2025)
+        self.assertEqual(Case.objects.create().latest_index_history.year, 2025)
+
+
+class ClosedPeriodTest(TestCase):
+    def setUp(self):
+        self.parent1 = User.objects.create_user(email='closing1@example.com', password='ComplexPassword1!', role='parent')
+        self.parent2 = User.objects.create_user(email='closing2@example.com', password='ComplexPassword1!', role='parent')
+        self.case = Case.objects.create()
+        ParentCase.objects.create(case=self.case, parent=self.parent1, percentage=50)
+        ParentCase.objects.create(case=self.case, parent=self.parent2, percentage=50)
+        self.category = Category.objects.create(name='Closing category', type=CategoryType.objects.create(name='Closing type'))
+        self.document = Document.objects.create(user=self.parent1, case=self.case, category=self.category,
+                                                amount=Decimal('40.00'), date=date(2023, 2, 1), status='validated')
+        self.case = Case.objects.with_parents().get(pk=self.case.pk)
+
+    def test_closed_quarter_is_read_from_its_snapshot(self):
+        close_period(self.case, 2023, 1)
+        CaseBalanceSummary.objects.filter(case=self.case).update(total=Decimal('999.00'))
+        ledger = get_case_ledger(self.case, self.case.parent1, self.case.parent2, 2023, 1)
+        self.assertEqual(ledger['parent1_total'], Decimal('40.00'))
+        self.assertEqual(ledger['years'], [2023])
+
+    def test_payments_of_a_closed_quarter_cannot_change(self):
+        close_period(self.case, 2023, 1)
+        self.document.amount = Decimal('50.00')
+        with self.assertRaises(PeriodClosedError):
+            self.document.save()
+        with self.assertRaises(PeriodClosedError):
+            self.document.delete()
+
+    def test_quarter_with_pending_payments_cannot_be_closed(self):
+        self.document.status = 'pending'
+        self.document.save()
+        with self.assertRaises(ValidationError):
+            close_period(self.case, 2023, 1)
+
+    def test_deleting_a_parent_removes_closed_payments(self):
+        close_period(self.case, 2023, 1)
+        admin = User.objects.create_superuser(email='closing-admin@example.com', password='ComplexPassword1!')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('accounts:delete_user', kwargs={'pk': self.parent1.pk}))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Document.objects.filter(pk=self.document.pk).exists())
+        ledger = get_case_ledger(self.case, self.case.parent1, self.case.parent2, 2023, 1)
+        self.assertEqual(ledger['parent1_total'], Decimal('40.00'))
+
+    def test_deleting_a_category_removes_closed_payments(self):
+        close_period(self.case, 2023, 1)
+        self.category.delete()
+        self.assertFalse(Document.objects.filter(pk=self.document.pk).exists())
@@ -0,0 +1,37 @@
+from datetime import date
+
+import numpy as np
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase
+
+from payments.projection import children_per_month, parse_projection_options, project_amounts, projection_months
+
+
+class ProjectionTest(SimpleTestCase):
+    def test_amounts_grow_each_january_per_scenario(self):
+        months = projection_months(date(2024, 11, 15), 1)
+        amounts = project_amounts(10000, 2024, months, [0, 2])
+        self.assertEqual(amounts.shape, (2, 12))
+        self.assertEqual(list(amounts[0][:3]), [10000, 10000, 10000])
+        self.assertEqual(list(amounts[1][:3]), [10000, 10000, 10200])
+
+    def test_children_count_between_birth_and_age_limit(self):
+        months = projection_months(date(2024, 1, 1), 1)
+        births = np.array([date(2006, 4, 10), date(2024, 6, 1), date(2010, 1, 1)], dtype='datetime64[M]')
+        counts = children_per_month(np.array([0, 0, 1]), births, 2, months, until_age=18)
+        # Premier enfant : 18 ans en avril 2024 ; second : né en juin 2024
+        self.assertEqual(list(counts[0]), [1, 1, 1, 0, 0, 1, 1, 1, 1, 1, 1, 1])
+        self.assertEqual(list(counts[1]), [1] * 12)
+
+    def test_options_within_limits(self):
+        options = parse_projection_options({'years': '10', 'rates': '0,2.5', 'until_age': '18'})
+        self.assertEqual(options, {'years': 10, 'rates': [0.0, 2.5], 'until_age': 18})
+
+    def test_negative_age_limit_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            parse_projection_options({'until_age': '-1'})
+
+    def test_non_finite_rates_are_rejected(self):
+        for rates in ('inf', '-inf', 'nan', '0,nan', '1e6'):
+            with self.subTest(rates=rates), self.assertRaises(ValidationError):
+                parse_projection_options({'rates': rates})
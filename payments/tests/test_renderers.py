@@ -0,0 +1,67 @@
+import os
+import time
+import unittest
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from payments.ledger import build_ledger
+from payments.renderers import ReportLabStatementRenderer, XhtmlStatementRenderer, get_statement_renderer
+
+
+def synthetic_parent(first_name, last_name):
+    return SimpleNamespace(first_name=first_name, last_name=last_name,
+                           get_full_name=lambda: f'{first_name} {last_name}')
+
+
+def synthetic_context(rows):
+    # Une ligne de grand livre par catégorie : c'est la taille du tableau qui compte pour le rendu
+    ledger = build_ledger([
+        {
+            'category__type': index % 4,
+            'category__type__name': f'Type {index % 4}',
+            'category': index,
+            'category__name': f'Category {index}',
+            'year': 2024,
+            'quarter': 1,
+            'parent1_amount': Decimal('12.50'),
+            'parent2_amount': Decimal('7.25'),
+            'parent1_pending_amount': Decimal('1.00') if index % 3 == 0 else 0,
+        } for index in range(rows)
+    ])
+    parent1 = synthetic_parent('Anne', 'Martin')
+    context = {
+        'case': SimpleNamespace(pk='synthetic'),
+        'parent1_user': parent1,
+        'parent2_user': synthetic_parent('Paul', 'Dubois'),
+        'difference': abs(ledger['parent1_total'] - ledger['parent2_total']),
+        'in_favor_of': parent1,
+        'selected_year': 2024,
+        'selected_quarter': 1,
+    }
+    context.update(ledger)
+    return context
+
+
+class StatementRendererTest(SimpleTestCase):
+    def test_both_backends_produce_a_pdf(self):
+        context = synthetic_context(10)
+        for renderer in (XhtmlStatementRenderer(), ReportLabStatementRenderer()):
+            with self.subTest(renderer=renderer.name):
+                self.assertTrue(renderer.render(context).startswith(b'%PDF'))
+
+    def test_renderer_is_chosen_by_setting(self):
+        with self.settings(STATEMENT_RENDERER='reportlab'):
+            self.assertIsInstance(get_statement_renderer(), ReportLabStatementRenderer)
+
+
+@unittest.skipUnless(os.environ.get('STATEMENT_BENCHMARK'), 'set STATEMENT_BENCHMARK=1 to run the renderer benchmark')
+class StatementRendererBenchmark(SimpleTestCase):
+    def test_compare_backends(self):
+        for rows in (10, 1000, 10000):
+            context = synthetic_context(rows)
+            for renderer in (XhtmlStatementRenderer(), ReportLabStatementRenderer()):
+                started = time.perf_counter()
+                renderer.render(context)
+                print(f'{renderer.name:>10} {rows:>6} rows: {time.perf_counter() - started:.2f}s')
@@ -1,8 +1,14 @@
+import io
+import zipfile
+from unittest import mock
+
 from django.utils import timezone
 from django.test import TestCase, Client
 from django.urls import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
-from payments.models import Child, Case
+from accounts.models import ParentCase
+from payments.models import Child, Case, CaseBalanceSummary, Category, CategoryType, Document, parent_pair_key
 
 User = get_user_model()
 
@@ -31,4 +37,188 @@ class ChildViewTestCase(TestCase):
 
     def test_child_create_view(self):
         response = self.client.get(reverse('payments:child', kwargs={'case_id': self.case.id}))
-        self.assertEqual(response.status_code, 200)
\ No newline at end of file
+        self.assertEqual(response.status_code, 200)
+
+class PendingPaymentsReviewTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.lawyer = User.objects.create_user(email='review-lawyer@example.com', password='ComplexPassword1!', role='lawyer')
+        self.client.login(email='review-lawyer@example.com', password='ComplexPassword1!')
+
+        self.parent = User.objects.create_user(email='review-parent@example.com', password='ComplexPassword1!', role='parent')
+        self.case = Case.objects.create()
+        ParentCase.objects.create(case=self.case, parent=self.parent)
+        category = Category.objects.create(name='Review', type=CategoryType.objects.create(name='Review type'))
+        self.pending = Document.objects.create(user=self.parent, case=self.case, category=category, amount=10)
+        self.validated = Document.objects.create(user=self.parent, case=self.case, category=category, amount=20, status='validated')
+
+    def test_bulk_validate_reports_each_id(self):
+        response = self.client.post(
+            reverse('payments:pending-payments', kwargs={'case_id': self.case.id}),
+            {'action': 'validate', 'payments': f'{self.pending.id},{self.validated.id},42'},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.json()['results'], {
+            str(self.pending.id): 'validated',
+            str(self.validated.id): 'not_pending',
+            '42': 'invalid',
+        })
+        self.assertEqual(Document.objects.get(pk=self.pending.pk).status, 'validated')
+
+
+class LedgerExportTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.parent = User.objects.create_user(email='export-parent@example.com', password='ComplexPassword1!', role='parent',
+                                               first_name='Anne', last_name='Martin')
+        self.case = Case.objects.create()
+        ParentCase.objects.create(case=self.case, parent=self.parent)
+        category = Category.objects.create(name='Export', type=CategoryType.objects.create(name='Export type'))
+        Document.objects.create(user=self.parent, case=self.case, category=category, amount='12.50', date='2024-02-01',
+                                status='validated')
+
+    def test_case_export_streams_csv(self):
+        self.client.login(email='export-parent@example.com', password='ComplexPassword1!')
+        response = self.client.get(reverse('payments:export_ledger', kwargs={'case_id': self.case.id}))
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'case,date,parent,category,type,amount,status,receipt')
+        self.assertEqual(lines[1], f'{self.case.id},2024-02-01,Anne Martin,Export,Export type,12.50,validated,')
+
+    def test_formula_cells_are_escaped(self):
+        self.parent.first_name = '=HYPERLINK("http://example.com")'
+        self.parent.save()
+        self.client.login(email='export-parent@example.com', password='ComplexPassword1!')
+        response = self.client.get(reverse('payments:export_ledger', kwargs={'case_id': self.case.id}))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertIn(',"\'=HYPERLINK(""http://example.com"") Martin",', lines[1])
+
+    def test_portfolio_export_is_refused_to_parents(self):
+        self.client.login(email='export-parent@example.com', password='ComplexPassword1!')
+        response = self.client.get(reverse('payments:export_portfolio'))
+        self.assertEqual(response.status_code, 403)
+
+
+class DossierDownloadTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.lawyer = User.objects.create_user(email='dossier-lawyer@example.com', password='ComplexPassword1!', role='lawyer')
+        self.client.login(email='dossier-lawyer@example.com', password='ComplexPassword1!')
+        parent = User.objects.create_user(email='dossier-parent@example.com', password='ComplexPassword1!', role='parent')
+        self.case = Case.objects.create()
+        ParentCase.objects.create(case=self.case, parent=parent)
+        category = Category.objects.create(name='Dossier', type=CategoryType.objects.create(name='Dossier type'))
+        Document.objects.create(user=parent, case=self.case, category=category, amount=15, date='2024-03-01')
+
+    def test_dossier_is_streamed_as_zip(self):
+        with mock.patch('payments.dossiers.statement_bytes', return_value=b'%PDF-1.4'):
+            response = self.client.get(reverse('payments:download_dossier', kwargs={'case_id': self.case.id}))
+            content = b''.join(response.streaming_content)
+
+        archive = zipfile.ZipFile(io.BytesIO(content))
+        self.assertIsNone(archive.testzip())
+        self.assertIn('index.csv', archive.namelist())
+        self.assertIn('2024-03-01', archive.read('index.csv').decode())
+
+
+class ImportPaymentsTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.parent = User.objects.create_user(email='import-parent@example.com', password='ComplexPassword1!', role='parent')
+        self.client.login(email='import-parent@example.com', password='ComplexPassword1!')
+        self.case = Case.objects.create()
+        ParentCase.objects.create(case=self.case, parent=self.parent)
+        Category.objects.create(name='Orthodontie', type=CategoryType.objects.create(name='Import type'))
+
+    def test_valid_rows_are_created_and_errors_reported(self):
+        content = 'date;montant;catégorie\n2024-01-10;12,50;Orthodontie\n2024-01-11;abc;Orthodontie\n2024-01-12;5;Inconnue\n'
+        response = self.client.post(reverse('payments:import-payments', kwargs={'case_id': self.case.id}), {
+            'format': 'csv',
+            'file': SimpleUploadedFile('export.csv', content.encode()),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['report']['created'], 1)
+        self.assertEqual([line for line, message in response.context['report']['errors']], [3, 4])
+        self.assertEqual(Document.objects.get(case=self.case).amount, 12.5)
+        self.assertTrue(CaseBalanceSummary.objects.filter(case=self.case).exists())
+
+    def test_parent_cannot_import_for_the_other_parent_or_import_refunds(self):
+        other = User.objects.create_user(email='import-other@example.com', password='ComplexPassword1!', role='parent')
+        ParentCase.objects.create(case=self.case, parent=other)
+        content = 'date;montant;catégorie;email\n2024-01-10;12,50;Orthodontie;import-other@example.com\n2024-01-11;-8,00;Orthodontie;\n'
+        response = self.client.post(reverse('payments:import-payments', kwargs={'case_id': self.case.id}), {
+            'format': 'csv',
+            'file': SimpleUploadedFile('export.csv', content.encode()),
+        })
+        self.assertEqual(response.context['report']['created'], 0)
+        self.assertEqual([line for line, message in response.context['report']['errors']], [2, 3])
+        self.assertFalse(Document.objects.filter(case=self.case).exists())
+
+
+class MultiplePaymentsTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.parent = User.objects.create_user(email='multi-parent@example.com', password='ComplexPassword1!', role='parent')
+        self.client.login(email='multi-parent@example.com', password='ComplexPassword1!')
+        self.case = Case.objects.create()
+        ParentCase.objects.create(case=self.case, parent=self.parent)
+        self.category = Category.objects.create(name='Multi', type=CategoryType.objects.create(name='Multi type'))
+
+    def formset_data(self, rows):
+        data = {'form-TOTAL_FORMS': str(len(rows)), 'form-INITIAL_FORMS': '0', 'form-MAX_NUM_FORMS': '50'}
+        for index, (amount, date) in enumerate(rows):
+            data.update({
+                f'form-{index}-amount': amount,
+                f'form-{index}-date': date,
+                f'form-{index}-category': str(self.category.pk),
+            })
+        return data
+
+    def test_rows_are_created_together(self):
+        response = self.client.post(
+            reverse('payments:add-payments', kwargs={'case_id': self.case.id}),
+            self.formset_data([('10.00', '2024-01-01'), ('20.00', '2024-01-02')]),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.json(), {'success': True, 'created': 2})
+        self.assertEqual(Document.objects.filter(case=self.case, user=self.parent).count(), 2)
+        self.assertEqual(CaseBalanceSummary.objects.get(case=self.case).total, 30)
+
+    def test_one_invalid_row_rejects_the_whole_submission(self):
+        response = self.client.post(
+            reverse('payments:add-payments', kwargs={'case_id': self.case.id}),
+            self.formset_data([('10.00', '2024-01-01'), ('abc', '2024-01-02')]),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Document.objects.filter(case=self.case).exists())
+
+    def test_empty_submission_reports_a_formset_error(self):
+        response = self.client.post(
+            reverse('payments:add-payments', kwargs={'case_id': self.case.id}),
+            self.formset_data([]),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()['non_form_errors']), ["Aucun paiement à ajouter."])
+
+
+class CombineDraftsTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_user(email='combine-lawyer@example.com', password='ComplexPassword1!', role='lawyer')
+        self.client.login(email='combine-lawyer@example.com', password='ComplexPassword1!')
+        self.parent1 = User.objects.create_user(email='combine1@example.com', password='ComplexPassword1!', role='parent')
+        self.parent2 = User.objects.create_user(email='combine2@example.com', password='ComplexPassword1!', role='parent')
+        self.draft1 = Case.objects.create(draft=True)
+        ParentCase.objects.create(case=self.draft1, parent=self.parent1)
+        self.draft2 = Case.objects.create(draft=True)
+        ParentCase.objects.create(case=self.draft2, parent=self.parent2)
+
+    def test_combined_case_keeps_its_parent_pair_key(self):
+        url = reverse('payments:combine_drafts') + f'?draft1={self.draft1.id}'
+        self.client.post(url, {'draft1': self.draft1.id, 'draft2': self.draft2.id})
+        self.draft1.refresh_from_db()
+        self.assertFalse(self.draft1.draft)
+        self.assertEqual(self.draft1.parent_pair_key, parent_pair_key([self.parent1.pk, self.parent2.pk]))
+        self.assertFalse(Case.objects.filter(pk=self.draft2.pk).exists())
@@ -25,7 +25,10 @@ from django.conf import settings
 from .views import (PaymentHistoryView, CaseListView, CategoryPaymentsView, add_category,
                     PaymentHistoryPDFView, index_payments, delete_indexation, submit_payment_document, create_case,
                     pending_payments, add_juge_avocat, remove_juge, remove_avocat, create_draft_case, DraftCaseListView,
-                    convert_draft_case, combine_drafts, add_child, delete_child, update_percentages, delete_payment)
+                    convert_draft_case, combine_drafts, add_child, delete_child, update_percentages, delete_payment,
+                    export_case_ledger, export_portfolio_ledger, download_dossier, import_payment_documents,
+                    submit_payment_documents, project_case_contributions, project_portfolio_contributions,
+                    close_case_period)
 
 app_name = 'payments'
 urlpatterns = [
@@ -39,8 +42,16 @@ urlpatterns = [
     path('cases/convert_draft/<uuid:case_id>/', convert_draft_case, name='convert-draft-case'),
     path('cases/combine_drafts/', combine_drafts, name='combine_drafts'),
     path('download_pdf/<uuid:case_id>/', PaymentHistoryPDFView.as_view(), name='download_pdf'),
+    path('export/<uuid:case_id>/', export_case_ledger, name='export_ledger'),
+    path('export/', export_portfolio_ledger, name='export_portfolio'),
+    path('dossier/<uuid:case_id>/', download_dossier, name='download_dossier'),
+    path('close-period/<uuid:case_id>/', close_case_period, name='close_period'),
+    path('projection/<uuid:case_id>/', project_case_contributions, name='project_contributions'),
+    path('projection/', project_portfolio_contributions, name='project_portfolio'),
     path('pending-payments/<uuid:case_id>/', pending_payments, name='pending-payments'),
     path('add-payment/<uuid:case_id>/', submit_payment_document, name='add-payment'),
+    path('add-payments/<uuid:case_id>/', submit_payment_documents, name='add-payments'),
+    path('import-payments/<uuid:case_id>/', import_payment_documents, name='import-payments'),
     path('index_payments/', index_payments, name='index_payments'),
     path('delete-indexation/<uuid:index_id>/', delete_indexation, name='delete_indexation'),
     path('add-judge-parent/<uuid:case_id>/', add_juge_avocat, name='add-juge-avocat'),
@@ -18,33 +18,46 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-from datetime import datetime
+import uuid
 from decimal import Decimal, ROUND_HALF_UP
 
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.exceptions import PermissionDenied
-from django.db import transaction
-from django.db.models import Sum, Q, F
-from django.db.models.functions import ExtractQuarter, ExtractYear
-from django.http import JsonResponse, HttpResponse, HttpResponseNotFound, HttpResponseForbidden, Http404
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import IntegrityError, transaction
+from django.http import FileResponse, JsonResponse, HttpResponse, HttpResponseNotFound, HttpResponseForbidden, Http404, \
+    HttpResponseBadRequest
 from django.shortcuts import render, redirect, get_object_or_404
-from django.template.loader import render_to_string
+from django.urls import reverse
 from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.utils.text import capfirst
+from django.utils.translation import gettext as _
 from django.views import View
 from django.views.decorators.http import require_POST
 from django.views.generic import ListView
-from xhtml2pdf import pisa
 
 
-from accounts.models import JugeCase, AvocatCase, ParentCase
+from accounts.access import get_case_access
+from accounts.memberships import assign_magistrates, unassign_from_cases
+from accounts.models import JugeCase, AvocatCase, ParentCase, CaseMembership
+from .indexation import get_current_index, get_index_history, has_index_for_year
+from .ledger import build_payment_history_context
 from .forms import PaymentDocumentForm, CaseForm, IndexPaymentForm, AddJugeAvocatForm, \
-    ConvertDraftCaseForm, CombineDraftsForm, ChildForm
-from .models import Document, Case, Category, CategoryType, IndexHistory, Child
+    ConvertDraftCaseForm, CombineDraftsForm, ChildForm, ImportPaymentsForm, PaymentDocumentFormSet
+from .caches import get_category, get_category_type, get_grouped_categories
+from .closing import PeriodClosedError, close_period, get_closed_quarters
+from .dossiers import dossier_response
+from .exports import export_response, xlsx_available
+from .imports import PARSERS, ImportFileError, import_payments
+from .models import Document, Case, Category, IndexHistory, Child, normalize_search, parent_pair_key
+from .periods import parse_period, period_filter, quarter_range
+from .projection import parse_projection_options, project_contributions, projection_summary
+from .statements import request_statement, statement_filename, statement_period
+from .submissions import create_payment_documents
+from .summaries import document_entry, record_document_changes
 
 User = get_user_model()
 
@@ -62,7 +75,7 @@ class CaseListView(LoginRequiredMixin, ListView):
         case_id = self.kwargs.get('pk')
         if case_id:
             case = get_object_or_404(Case, pk=case_id)
-            if not self.has_access_to_case(request.user, case):
+            if not self.has_access_to_case(case):
                 raise Http404("You do not have permission to access this case.")
 
         return response
@@ -70,24 +83,16 @@ class CaseListView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         user = self.request.user
 
-        parent_cases = Case.objects.filter(parent_cases__parent=user)
-        avocat_cases = Case.objects.filter(id__in=AvocatCase.objects.filter(avocat=user).values('case_id'))
-        juge_cases = Case.objects.filter(id__in=JugeCase.objects.filter(juge=user).values('case_id'))
+        return Case.objects.filter(id__in=CaseMembership.objects.filter(user=user).values('case_id')).with_parents()
 
-        queryset = parent_cases | avocat_cases | juge_cases
-
-        return queryset.distinct()
-
-    def has_access_to_case(self, user, case):
-        return ParentCase.objects.filter(parent=user, case=case).exists() or \
-               AvocatCase.objects.filter(avocat=user, case=case).exists() or \
-               JugeCase.objects.filter(juge=user, case=case).exists()
+    def has_access_to_case(self, case):
+        return get_case_access(self.request).is_member(case)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.request.user
 
-        context['can_create_draft'] = not Case.objects.filter(parent_cases__parent=user, draft=False).exists()
+        context['can_create_draft'] = not CaseMembership.objects.filter(user=user, role='parent', case__draft=False).exists()
 
         return context
 
@@ -101,11 +106,11 @@ class PaymentHistoryView(LoginRequiredMixin, ListView):
         case_id = kwargs.get('case_id')
 
         if case_id:
-            self.case = get_object_or_404(Case, pk=case_id)
+            self.case = get_object_or_404(Case.objects.with_parents(), pk=case_id)
         else:
             return self.handle_no_case_id()
 
-        if not self.user_has_access_to_case(request.user, self.case):
+        if not self.user_has_access_to_case(self.case):
             return self.handle_no_access()
 
         return super().dispatch(request, *args, **kwargs)
@@ -116,152 +121,30 @@ class PaymentHistoryView(LoginRequiredMixin, ListView):
     def handle_no_access(self):
         return HttpResponseForbidden("You do not have permission to access this case.")
 
-    def user_has_access_to_case(self, user, case):
-        return case.parent1 == user or case.parent2 == user or user.role in ["lawyer", "judge", "administrator"] or (case.draft and case.parent1 == user)
+    def user_has_access_to_case(self, case):
+        return get_case_access(self.request).can_view(case)
 
     def get_queryset(self):
-        queryset = Document.objects.filter(case=self.case)
-        selected_year = self.request.GET.get('year')
-        selected_quarter = self.request.GET.get('quarter')
-
-        if selected_year and selected_quarter:
-            try:
-                selected_year = int(selected_year)
-                selected_quarter = int(selected_quarter)
-
-                start_month = (selected_quarter - 1) * 3 + 1
-                end_month = start_month + 2
-
-                start_date = timezone.datetime(selected_year, start_month, 1)
-                end_date = timezone.datetime(selected_year, end_month + 1, 1) if end_month < 12 else timezone.datetime(selected_year + 1, 1, 1)
-
-                queryset = queryset.filter(date__gte=start_date, date__lt=end_date)
-            except (TypeError, ValueError):
-                queryset = Document.objects.filter(case=self.case)
-        return queryset
+        selected_year, selected_quarter = parse_period(self.request.GET.get('year'), self.request.GET.get('quarter'))
+        return Document.objects.filter(case=self.case, **period_filter(selected_year, selected_quarter))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        case = self.case
-        parent1 = case.parent1
-        parent2 = case.parent2
         user = self.request.user
 
-        selected_year = self.request.GET.get('year')
-        selected_quarter = self.request.GET.get('quarter')
-
-        latest_index_history = IndexHistory.objects.order_by('-created_at').first()
-        contribution_amount = 0
-        if latest_index_history:
-            contribution_amount = latest_index_history.amount * case.number_of_children
-
-        if selected_year and selected_quarter:
-            try:
-                parent1_valid_payments = self.get_payments(case, parent1, 'validated', selected_year, selected_quarter)
-                parent2_valid_payments = self.get_payments(case, parent2, 'validated', selected_year, selected_quarter)
-                parent1_pending_payments = self.get_payments(case, parent1, 'pending', selected_year, selected_quarter)
-                parent2_pending_payments = self.get_payments(case, parent2, 'pending', selected_year, selected_quarter)
-            except (TypeError, ValueError):
-                parent1_valid_payments = []
-                parent2_valid_payments = []
-                parent1_pending_payments = []
-                parent2_pending_payments = []
-        else:
-            parent1_valid_payments = self.get_payments(case, parent1, 'validated')
-            parent2_valid_payments = self.get_payments(case, parent2, 'validated')
-            parent1_pending_payments = self.get_payments(case, parent1, 'pending')
-            parent2_pending_payments = self.get_payments(case, parent2, 'pending')
-
-        context.update(self.build_context(case, parent1, parent2, parent1_valid_payments, parent2_valid_payments, parent1_pending_payments, parent2_pending_payments, contribution_amount))
+        selected_year, selected_quarter = parse_period(self.request.GET.get('year'), self.request.GET.get('quarter'))
+        context.update(build_payment_history_context(self.case, selected_year, selected_quarter))
+        context['selected_year'], context['selected_quarter'] = selected_year, selected_quarter
+        context['can_close_period'] = (
+            selected_quarter is not None and context['closed_period'] is None and user.role in ('lawyer', 'administrator')
+            and quarter_range(selected_year, selected_quarter)[1] <= timezone.localdate()
+        )
 
         payments_with_permissions = [{'payment': payment, 'can_delete': payment.user_can_delete(user)} for payment in self.get_queryset()]
         context['payments_with_permissions'] = payments_with_permissions
 
         return context
 
-    def get_payments(self, case, parent, status, year=None, quarter=None):
-        queryset = Document.objects.filter(case=case, user=parent, category__type__isnull=False, status=status)
-        if year and quarter:
-            queryset = queryset.filter(date__year=year, date__quarter=quarter)
-        return queryset.values('category__type', 'category').annotate(total_amount=Sum('amount'))
-
-    def build_context(self, case, parent1, parent2, parent1_valid_payments, parent2_valid_payments, parent1_pending_payments, parent2_pending_payments, contribution_amount):
-        parent1_valid_payments_dict = {(payment['category__type'], payment['category']): payment['total_amount'] for payment in parent1_valid_payments}
-        parent2_valid_payments_dict = {(payment['category__type'], payment['category']): payment['total_amount'] for payment in parent2_valid_payments}
-        parent1_pending_dict = {(payment['category__type'], payment['category']): payment['total_amount'] for payment in parent1_pending_payments}
-        parent2_pending_dict = {(payment['category__type'], payment['category']): payment['total_amount'] for payment in parent2_pending_payments}
-
-        # Calculer les pourcentages à partir des ParentCase
-        parent_cases = case.parent_cases.all()
-        parent1_percentage = parent_cases.filter(parent=case.parent1).first().percentage if case.parent1 else 0
-        parent2_percentage = parent_cases.filter(parent=case.parent2).first().percentage if case.parent2 else 0
-
-        categories = Category.objects.filter(type__isnull=False)
-        categories_by_type = {}
-        category_ids = []
-
-        for category in categories:
-            category_type_id = category.type_id
-            parent1_amount = parent1_valid_payments_dict.get((category_type_id, category.id), 0)
-            parent2_amount = parent2_valid_payments_dict.get((category_type_id, category.id), 0)
-            parent1_pending_amount = parent1_pending_dict.get((category_type_id, category.id), 0)
-            parent2_pending_amount = parent2_pending_dict.get((category_type_id, category.id), 0)
-
-            if parent1_amount == 0 and parent2_amount == 0 and parent1_pending_amount == 0 and parent2_pending_amount == 0:
-                continue
-
-            category_ids.append(category.id)
-
-            if category_type_id not in categories_by_type:
-                categories_by_type[category_type_id] = {
-                    'type_name': category.type.name,
-                    'categories': [],
-                }
-            categories_by_type[category_type_id]['categories'].append({
-                'category_id': category.id,
-                'category_name': category.name,
-                'parent1_amount': parent1_amount,
-                'parent2_amount': parent2_amount,
-                'parent1_pending_amount': parent1_pending_amount,
-                'parent2_pending_amount': parent2_pending_amount,
-            })
-
-        parent1_total = sum(parent1_valid_payments_dict.values())
-        parent2_total = sum(parent2_valid_payments_dict.values())
-        difference = abs(parent1_total - parent2_total)
-        in_favor_of = parent1 if parent1_total > parent2_total else parent2
-
-        payment_years = Document.objects.filter(case=case).dates('date', 'year')
-        years = [year.year for year in payment_years]
-
-        active_quarters = Document.objects.annotate(
-            quarter=ExtractQuarter('date'),
-            year=ExtractYear('date')
-        ).filter(case=case).values_list('year', 'quarter').distinct()
-
-        active_quarters_per_year = {year: set() for year in years}
-        for year, quarter in active_quarters:
-            active_quarters_per_year[year].add(quarter)
-
-        return {
-            'case': case,
-            'parent1_user': parent1,
-            'parent2_user': parent2,
-            'categories_by_type': categories_by_type,
-            'parent1_total': parent1_total,
-            'parent2_total': parent2_total,
-            'total_amount': parent1_total + parent2_total,
-            'difference': difference,
-            'in_favor_of': in_favor_of,
-            'years': years,
-            'category_ids': category_ids,
-            'is_draft': case.draft,
-            'contribution_amount': contribution_amount,
-            'parent1_percentage': parent1_percentage,
-            'parent2_percentage': parent2_percentage,
-            'active_quarters_per_year': active_quarters_per_year,
-        }
-
 
 class CategoryPaymentsView(LoginRequiredMixin, ListView):
     model = Document
@@ -274,11 +157,15 @@ class CategoryPaymentsView(LoginRequiredMixin, ListView):
         case_id = self.kwargs.get('case_id')
 
         # Vérifier et récupérer la catégorie
-        category = get_object_or_404(Category, id=category_id)
+        category = get_category(category_id)
+        if category is None:
+            raise Http404
         context['category'] = category
 
         # Obtenir le dossier basé sur le case_id et les droits d'accès
-        case = get_object_or_404(Case, id=case_id)
+        case = get_object_or_404(Case.objects.with_parents(), id=case_id)
+        if not get_case_access(self.request).can_view(case):
+            raise PermissionDenied
         context['case'] = case
 
         # Récupérer les paiements pour les parents
@@ -286,15 +173,9 @@ class CategoryPaymentsView(LoginRequiredMixin, ListView):
         parent2_payments = Document.objects.filter(case=case, category_id=category_id, user=case.parent2)
 
         # Appliquer les filtres pour l'année et le trimestre
-        year = self.request.GET.get('year')
-        quarter = self.request.GET.get('quarter')
-        if year and quarter:
-            try:
-                start_date, end_date = self.get_quarter_dates(year, quarter)
-                parent1_payments = parent1_payments.filter(date__range=(start_date, end_date))
-                parent2_payments = parent2_payments.filter(date__range=(start_date, end_date))
-            except ValueError as e:
-                print(f"Error in date range calculation: {e}")
+        year, quarter = parse_period(self.request.GET.get('year'), self.request.GET.get('quarter'))
+        parent1_payments = parent1_payments.filter(**period_filter(year, quarter))
+        parent2_payments = parent2_payments.filter(**period_filter(year, quarter))
 
         context['parent1_payments'] = parent1_payments
         context['parent2_payments'] = parent2_payments
@@ -304,85 +185,139 @@ class CategoryPaymentsView(LoginRequiredMixin, ListView):
         # Ajouter les paramètres année et trimestre au contexte
         context['selected_year'] = year
         context['selected_quarter'] = quarter
+        # Les paiements d'un trimestre clôturé ne peuvent plus être supprimés
+        context['closed_period'] = year is not None and (year, quarter) in get_closed_quarters(case.pk)
 
         return context
 
-    def get_quarter_dates(self, year, quarter):
-        year = int(year)
-        quarter = int(quarter)
-        start_month = (quarter - 1) * 3 + 1
-        end_month = start_month + 2
-
-        start_date = datetime(year, start_month, 1)
-        if end_month < 12:
-            end_date = datetime(year, end_month + 1, 1)
-        else:
-            end_date = datetime(year + 1, 1, 1)
-        return start_date, end_date
-
 
 class PaymentHistoryPDFView(LoginRequiredMixin, View):
-    def get(self, request, case_id=None, *args, **kwargs):
-        user = self.request.user
+    # Le PDF est rendu en arrière-plan : 202 tant qu'il n'est pas prêt, puis le fichier en cache
+    poll_interval = 2
 
+    def get(self, request, case_id=None, *args, **kwargs):
         # Vérifier si case_id est fourni
         if case_id is None:
             return HttpResponse("No case_id provided.", status=400)
 
         case = get_object_or_404(Case, id=case_id)
+        if not get_case_access(request).can_view(case):
+            return HttpResponseForbidden("You do not have permission to access this case.")
 
         # Obtenir les paramètres de la requête GET
-        selected_year = request.GET.get('year', None)
-        selected_quarter = request.GET.get('quarter', None)
+        selected_year, selected_quarter = parse_period(request.GET.get('year'), request.GET.get('quarter'))
 
-        # Vérifier et convertir les paramètres en entiers si valides
-        if selected_year and selected_year.isdigit():
-            selected_year = int(selected_year)
-        else:
-            selected_year = None
+        status, result = request_statement(case, selected_year, selected_quarter)
+        if status == 'ready':
+            filename = statement_filename(*statement_period(selected_year, selected_quarter))
+            return FileResponse(open(result, 'rb'), as_attachment=True, filename=filename, content_type='application/pdf')
+        if status == 'failed':
+            return HttpResponse("The statement could not be generated. Please try again later.", status=500)
 
-        if selected_quarter and selected_quarter.isdigit():
-            selected_quarter = int(selected_quarter)
-        else:
-            selected_quarter = None
+        poll_url = request.get_full_path()
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({'status': 'pending', 'poll_url': poll_url}, status=202)
 
-        # Créer une instance de PaymentHistoryView pour obtenir les données
-        payment_history_view = PaymentHistoryView()
-        payment_history_view.request = request
-        payment_history_view.kwargs = {'case_id': case_id}  # Passer case_id comme kwargs
-        payment_history_view.case = case
+        response = HttpResponse(_("The PDF statement is being generated, the download will start shortly."), status=202)
+        response['Refresh'] = f'{self.poll_interval}; url={poll_url}'
+        return response
 
-        # Appeler dispatch pour initialiser la vue correctement
-        payment_history_view.dispatch(request, *args, **kwargs)
 
-        # Obtenir object_list en appelant get_queryset()
-        payment_history_view.object_list = payment_history_view.get_queryset()
+def get_export_format(request):
+    export_format = request.GET.get('format', 'csv')
+    if export_format == 'csv' or (export_format == 'xlsx' and xlsx_available()):
+        return export_format
+    return None
 
-        # Obtenir le contexte de la vue PaymentHistoryView
-        context = payment_history_view.get_context_data()
 
-        # Déterminer le nom du fichier PDF
-        if selected_year is None or selected_quarter is None:
-            context['selected_year'] = datetime.now().year
-            context['selected_quarter'] = None
-            filename = f'PaymentHistory_{context["selected_year"]}.pdf'
-        else:
-            context['selected_year'] = selected_year
-            context['selected_quarter'] = selected_quarter
-            filename = f'PaymentHistory_{context["selected_year"]}_Q{context["selected_quarter"]}.pdf'
+@login_required
+def export_case_ledger(request, case_id):
+    case = get_object_or_404(Case, id=case_id)
+    if not get_case_access(request).can_view(case):
+        return HttpResponseForbidden("You do not have permission to access this case.")
 
-        # Rendre le template avec les données de contexte
-        html_string = render_to_string('payments/pdf_template.html', context)
+    export_format = get_export_format(request)
+    if export_format is None:
+        return HttpResponseBadRequest("Unsupported export format.")
+    return export_response([case.pk], f'ledger_{case.pk}', export_format, request)
 
-        # Générer le PDF
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        pisa_status = pisa.CreatePDF(html_string, dest=response)
 
-        if pisa_status.err:
-            return HttpResponse('We had some errors <pre>' + html_string + '</pre>')
+def get_portfolio_case_ids(user):
+    # Tous les dossiers suivis par l'avocat ou le juge connecté, ou tous les dossiers pour un administrateur
+    if user.role == 'administrator':
+        return Case.objects.values('id')
+    if user.role in ('lawyer', 'judge'):
+        return CaseMembership.objects.filter(user=user, role=user.role).values('case_id')
+    return None
+
+
+@login_required
+def export_portfolio_ledger(request):
+    case_ids = get_portfolio_case_ids(request.user)
+    if case_ids is None:
+        return HttpResponseForbidden("You do not have permission to export this portfolio.")
+
+    export_format = get_export_format(request)
+    if export_format is None:
+        return HttpResponseBadRequest("Unsupported export format.")
+    return export_response(case_ids, f'ledger_{timezone.now():%Y%m%d}', export_format, request)
+
+
+@login_required
+def project_case_contributions(request, case_id):
+    case = get_object_or_404(Case, id=case_id)
+    if not get_case_access(request).can_view(case):
+        return HttpResponseForbidden("You do not have permission to access this case.")
+    try:
+        options = parse_projection_options(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    except ValidationError as e:
+        return HttpResponseBadRequest(' '.join(e.messages))
+    return JsonResponse(projection_summary(project_contributions([case.pk], **options)))
+
+
+@login_required
+def project_portfolio_contributions(request):
+    case_ids = get_portfolio_case_ids(request.user)
+    if case_ids is None:
+        return HttpResponseForbidden("You do not have permission to access this portfolio.")
+    try:
+        options = parse_projection_options(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    except ValidationError as e:
+        return HttpResponseBadRequest(' '.join(e.messages))
+    result = project_contributions(case_ids, **options)
+    return JsonResponse(projection_summary(result, per_case=request.GET.get('per_case') == '1'))
+
+
+@require_POST
+@login_required
+def close_case_period(request, case_id):
+    case = get_object_or_404(Case.objects.with_parents(), id=case_id)
+    if request.user.role not in ('lawyer', 'administrator') or not get_case_access(request).can_view(case):
+        return HttpResponseForbidden("You do not have permission to close a period of this case.")
+
+    year, quarter = parse_period(request.POST.get('year'), request.POST.get('quarter'))
+    if year is None:
+        return HttpResponseBadRequest("A year and a quarter are required.")
+    try:
+        close_period(case, year, quarter, request.user)
+    except ValidationError as e:
+        messages.error(request, ' '.join(e.messages))
+    else:
+        messages.success(request, _("Le trimestre %(quarter)d de %(year)d est clôturé.") % {'quarter': quarter, 'year': year})
+    return redirect(f"{reverse('payments:payment-history', args=[case.pk])}?year={year}&quarter={quarter}")
 
-        return response
+
+@login_required
+def download_dossier(request, case_id):
+    # Relevé, index CSV et justificatifs du dossier, en une archive ZIP envoyée au fil de l'eau
+    case = get_object_or_404(Case.objects.with_parents(), id=case_id)
+    if not get_case_access(request).can_view(case):
+        return HttpResponseForbidden("You do not have permission to access this case.")
+    return dossier_response(case)
 
 
 @require_POST
@@ -403,7 +338,7 @@ def add_category(request):
                 return JsonResponse({'success': False, 'error': 'Category already exists.'})
 
             # Get or create the "Autre" category type
-            category_type_autre, created = CategoryType.objects.get_or_create(name="Autre")
+            category_type_autre = get_category_type("Autre")
 
             # Create the new category
             new_category = Category.objects.create(
@@ -423,30 +358,6 @@ def add_category(request):
     return JsonResponse({'success': False, 'error': 'Invalid request.'})
 
 
-def get_quarter_dates(year, quarter):
-    try:
-        quarter = int(quarter)  # Assurez-vous que quarter est un entier
-    except ValueError:
-        raise ValueError("Quarter should be an integer between 1 and 4")
-
-    if quarter == 1:
-        start_date = timezone.datetime(int(year), 1, 1).date()
-        end_date = timezone.datetime(int(year), 3, 31).date()
-    elif quarter == 2:
-        start_date = timezone.datetime(int(year), 4, 1).date()
-        end_date = timezone.datetime(int(year), 6, 30).date()
-    elif quarter == 3:
-        start_date = timezone.datetime(int(year), 7, 1).date()
-        end_date = timezone.datetime(int(year), 9, 30).date()
-    elif quarter == 4:
-        start_date = timezone.datetime(int(year), 10, 1).date()
-        end_date = timezone.datetime(int(year), 12, 31).date()
-    else:
-        raise ValueError("Invalid quarter value. Must be between 1 and 4.")
-
-    return start_date, end_date
-
-
 @login_required
 def add_child(request, case_id):
     case = get_object_or_404(Case, id=case_id)
@@ -483,20 +394,17 @@ def submit_payment_document(request, case_id):
     case = get_object_or_404(Case, id=case_id)
 
     # Determine if the user is a parent
-    is_parent = case.parent_cases.filter(parent=user).exists()
+    is_parent = get_case_access(request).is_parent(case)
 
-    categories = Category.objects.order_by('type', 'name')
-    grouped_categories = {}
-    for category in categories:
-        if category.type not in grouped_categories:
-            grouped_categories[category.type] = []
-        grouped_categories[category.type].append(category)
+    grouped_categories = get_grouped_categories()
 
     if request.method == 'POST':
+        closed_quarters = get_closed_quarters(case.pk)
         if is_parent:
-            form = PaymentDocumentForm(request.POST, request.FILES)
+            form = PaymentDocumentForm(request.POST, request.FILES, closed_quarters=closed_quarters)
         else:
-            form = PaymentDocumentForm(request.POST, request.FILES, parent_choices=get_parent_choices(case))
+            form = PaymentDocumentForm(request.POST, request.FILES, parent_choices=get_parent_choices(case),
+                                       closed_quarters=closed_quarters)
 
         new_category_name = request.POST.get('new_category_name', '').strip()
 
@@ -516,7 +424,7 @@ def submit_payment_document(request, case_id):
                     payment_document.user = None
 
             if new_category_name:
-                other_type, created = CategoryType.objects.get_or_create(name='Autre')
+                other_type = get_category_type('Autre')
                 new_category, created = Category.objects.get_or_create(
                     name=new_category_name,
                     defaults={'type': other_type}
@@ -540,18 +448,102 @@ def submit_payment_document(request, case_id):
     return render(request, 'payments/submit_payment_document.html', context)
 
 
+@login_required
+def submit_payment_documents(request, case_id):
+    # Plusieurs paiements (montant, date, catégorie, justificatif) validés ensemble et insérés en une transaction
+    case = get_object_or_404(Case.objects.with_parents(), id=case_id)
+    is_parent = get_case_access(request).is_parent(case)
+    if not is_parent and request.user.role not in ('lawyer', 'administrator'):
+        return HttpResponseForbidden("You do not have permission to access this case.")
+
+    form_kwargs = {'closed_quarters': get_closed_quarters(case.pk)}
+    if not is_parent:
+        form_kwargs['parent_choices'] = get_parent_choices(case)
+    formset = PaymentDocumentFormSet(request.POST or None, request.FILES or None, form_kwargs=form_kwargs)
+    is_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+
+    if request.method == 'POST':
+        documents = []
+        if formset.is_valid():
+            parents = {str(parent.id): parent for parent in case.parents}
+            for form in formset:
+                if not form.has_changed():
+                    continue
+                payment_document = form.save(commit=False)
+                payment_document.case = case
+                payment_document.status = 'validated'
+                payment_document.user = request.user if is_parent else parents.get(form.cleaned_data.get('parent'))
+                if payment_document.user is None:
+                    form.add_error('parent', _("Choisissez le parent qui a payé."))
+                documents.append(payment_document)
+
+        if documents and formset.is_valid():
+            create_payment_documents(case, documents)
+            if is_ajax:
+                return JsonResponse({'success': True, 'created': len(documents)})
+            messages.success(request, _("%(count)d paiements ajoutés.") % {'count': len(documents)})
+            return redirect('payments:payment-history', case_id=case_id)
+
+        if is_ajax:
+            return JsonResponse({
+                'success': False,
+                'errors': formset.errors,
+                'non_form_errors': formset.non_form_errors(),
+            }, status=400)
+
+    return render(request, 'payments/submit_payment_documents.html', {
+        'formset': formset,
+        'grouped_categories': get_grouped_categories(),
+        'case': case,
+    })
+
+
+@login_required
+def import_payment_documents(request, case_id):
+    # Import d'un export CSV ou CAMT : les lignes valides sont créées, les autres listées avec leur erreur
+    case = get_object_or_404(Case.objects.with_parents(), id=case_id)
+    is_parent = get_case_access(request).is_parent(case)
+    if not is_parent and request.user.role not in ('lawyer', 'administrator'):
+        return HttpResponseForbidden("You do not have permission to access this case.")
+
+    parent_choices = None if is_parent else get_parent_choices(case)
+    form = ImportPaymentsForm(request.POST or None, request.FILES or None, parent_choices=parent_choices)
+    report = None
+
+    if request.method == 'POST' and form.is_valid():
+        # Comme pour un paiement isolé, un parent n'enregistre que ses propres paiements
+        if is_parent:
+            default_parent, allowed_parents = request.user, [request.user]
+        else:
+            default_parent = next((parent for parent in case.parents if str(parent.id) == form.cleaned_data['parent']), None)
+            allowed_parents = None
+        rows = PARSERS[form.cleaned_data['format']](form.cleaned_data['file'].file)
+        try:
+            report = import_payments(case, rows, default_parent, allowed_parents=allowed_parents)
+        except ImportFileError:
+            form.add_error('file', _("Le fichier n'a pas pu être lu."))
+        else:
+            if report['created']:
+                messages.success(request, _("%(count)d paiements importés.") % {'count': report['created']})
+
+    return render(request, 'payments/import_payments.html', {'form': form, 'case': case, 'report': report})
+
+
 @login_required
 def delete_payment(request, payment_id, case_id, category_id):
     payment = get_object_or_404(Document, id=payment_id)
     case = get_object_or_404(Case, id=case_id)
 
-    if request.user == case.parent1 or request.user == case.parent2:
+    if get_case_access(request).is_parent(case):
         if request.user != payment.user:
             raise PermissionDenied
     elif not request.user.is_staff:
         raise PermissionDenied
 
-    payment.delete()
+    try:
+        payment.delete()
+    except PeriodClosedError as e:
+        messages.error(request, ' '.join(e.messages))
     return redirect('payments:category-payments', case_id=case_id, category_id=category_id)
 
 
@@ -563,12 +555,14 @@ def create_draft_case(request):
     if request.user.role != 'parent':
         return redirect('accounts:login')
 
-    existing_drafts_count = Case.objects.filter(parent1=request.user, draft=True).count()
+    existing_drafts_count = CaseMembership.objects.filter(user=request.user, role='parent', case__draft=True).count()
     if existing_drafts_count >= 3:
         messages.error(request, "You can only have up to 3 draft cases.")
         return redirect('payments:list_case')
 
-    draft_case = Case.objects.create(parent1=request.user, draft=True)
+    with transaction.atomic():
+        draft_case = Case.objects.create(draft=True)
+        ParentCase.objects.create(case=draft_case, parent=request.user, percentage=50)
 
     return redirect('payments:payment-history', case_id=draft_case.id)
 
@@ -593,15 +587,21 @@ def combine_drafts(request):
                 messages.error(request, "Cannot combine drafts of the same parent.")
                 return redirect('combine_drafts')
 
-            draft1.parent2 = draft2.parent1
-            draft1.draft = False
-            draft1.save()
-
-            for document in draft2.payment_documents.all():
-                document.case = draft1
-                document.save()
-
-            draft2.delete()
+            try:
+                with transaction.atomic():
+                    ParentCase.objects.create(case=draft1, parent=draft2.parent1, percentage=50)
+                    # Le signal de ParentCase a déjà mis à jour les champs dérivés en base : ne pas les écraser
+                    draft1.draft = False
+                    draft1.save(update_fields=['draft', 'updated_at'])
+
+                    for document in draft2.payment_documents.all():
+                        document.case = draft1
+                        document.save()
+
+                    draft2.delete()
+            except IntegrityError:
+                messages.error(request, "Un dossier avec ces deux parents existe déjà.")
+                return redirect('combine_drafts')
 
             messages.success(request, "Drafts have been combined successfully.")
             return redirect('payments:payment-history', case_id=draft1.id)
@@ -641,70 +641,117 @@ def create_case(request):
         if form.is_valid():
             parent1 = form.cleaned_data['parent1']
             parent2 = form.cleaned_data['parent2']
-            # Check if a case with the same parent1 and parent2 already exists
-            existing_case = Case.objects.filter(
-                parent_cases__parent=parent1
-            ).filter(
-                parent_cases__parent=parent2
-            ).exists() or Case.objects.filter(
-                parent_cases__parent=parent2
-            ).filter(
-                parent_cases__parent=parent1
-            ).exists()
+            key = parent_pair_key([parent1.pk, parent2.pk if parent2 else None])
 
             if parent1 == parent2:
                 messages.error(request, "Impossible de créer un dossier avec le même parent.")
-            elif existing_case:
+            elif key and Case.objects.filter(draft=False, parent_pair_key=key).exists():
                 messages.error(request, "Un dossier avec ces deux parents existe déjà.")
             else:
-                case = form.save(commit=False)
-                if request.user.role == 'administrator':
-                    case.lawyer = form.cleaned_data['lawyer']
+                try:
+                    with transaction.atomic():
+                        case = form.save(commit=False)
+                        if request.user.role == 'administrator':
+                            case.lawyer = form.cleaned_data['lawyer']
+                        else:
+                            case.lawyer = request.user
+                        # La contrainte case_unique_parent_pair refuse un doublon créé en parallèle
+                        case.parent_pair_key = key
+                        case.save()
+
+                        # Create AvocatCase entry
+                        AvocatCase.objects.create(
+                            avocat=case.lawyer,
+                            case=case
+                        )
+
+                        # Create ParentCase entries
+                        ParentCase.objects.create(case=case, parent=parent1, percentage=50)
+                        if parent2:
+                            ParentCase.objects.create(case=case, parent=parent2, percentage=50)
+                except IntegrityError:
+                    messages.error(request, "Un dossier avec ces deux parents existe déjà.")
                 else:
-                    case.lawyer = request.user
-                case.save()
-
-                # Create AvocatCase entry
-                AvocatCase.objects.create(
-                    avocat=case.lawyer,
-                    case=case
-                )
-
-                # Create ParentCase entries
-                ParentCase.objects.create(case=case, parent=parent1, percentage=50)
-                if parent2:
-                    ParentCase.objects.create(case=case, parent=parent2, percentage=50)
-
-                # Redirect to a list of cases or other success page
-                return redirect('payments:list_case')
+                    # Redirect to a list of cases or other success page
+                    return redirect('payments:list_case')
     else:
         form = CaseForm(initial={'parent1': request.user}, user=request.user)  # Initialiser avec l'utilisateur connecté par défaut
 
     return render(request, 'payments/create_case.html', {'form': form})
 
 
+REVIEW_ACTIONS = {
+    'validate': 'validated',
+    'reject': 'rejected',
+}
+
+
+def review_pending_payments(case, payment_ids, new_status):
+    """
+    Applique `new_status` aux paiements en attente du dossier en un seul UPDATE.
+
+    Retourne le résultat par ID : le nouveau statut, 'invalid', 'not_found' ou 'not_pending'.
+    """
+    results = {}
+    valid_ids = []
+    for payment_id in payment_ids:
+        payment_id = payment_id.strip()  # Enlever les espaces autour de chaque ID
+        if not payment_id:
+            continue
+        try:
+            valid_ids.append(uuid.UUID(payment_id))
+        except ValueError:
+            results[payment_id] = 'invalid'
+
+    with transaction.atomic():
+        documents = Document.objects.select_for_update().filter(case=case, id__in=valid_ids).only(
+            'case_id', 'user_id', 'category_id', 'date', 'status', 'amount',
+        )
+        current = {}
+        changes = []
+        for document in documents:
+            current[document.id] = document.status
+            if document.status == 'pending':
+                previous = document_entry(document)
+                document.status = new_status
+                changes.append((previous, document_entry(document)))
+        pending_ids = [payment_id for payment_id, status in current.items() if status == 'pending']
+        if pending_ids:
+            Document.objects.filter(id__in=pending_ids, case=case, status='pending').update(status=new_status)
+            # L'UPDATE ne déclenche pas les signaux : les résumés sont ajustés à partir des lignes verrouillées
+            record_document_changes(changes)
+
+    for payment_id in valid_ids:
+        status = current.get(payment_id)
+        if status is None:
+            results[str(payment_id)] = 'not_found'
+        elif status != 'pending':
+            results[str(payment_id)] = 'not_pending'
+        else:
+            results[str(payment_id)] = new_status
+    return results
+
+
 @login_required
 def pending_payments(request, case_id):
     case = get_object_or_404(Case, id=case_id)
-    payments = Document.objects.filter(case=case, status='pending')
 
     if request.method == 'POST':
-        action = request.POST.get('action')
-        payment_ids_string = request.POST.get('payments')  # Récupérer la chaîne des IDs de paiements
-        payment_ids = payment_ids_string.split(',')  # Séparer la chaîne en une liste d'IDs
-
-        for payment_id in payment_ids:
-            payment_id = payment_id.strip()  # Enlever les espaces autour de chaque ID
-            if payment_id:
-                payment = get_object_or_404(Document, id=int(payment_id))
-                if action == 'validate':
-                    payment.status = 'validated'
-                elif action == 'reject':
-                    payment.status = 'rejected'
-                payment.save()
+        if request.user.role not in ['lawyer', 'administrator']:
+            return HttpResponseForbidden("You do not have permission to review these payments.")
+
+        new_status = REVIEW_ACTIONS.get(request.POST.get('action'))
+        if new_status is None:
+            return JsonResponse({'success': False, 'error': 'Invalid action.'}, status=400)
 
+        payment_ids = request.POST.get('payments', '').split(',')  # Récupérer la chaîne des IDs de paiements
+        results = review_pending_payments(case, payment_ids, new_status)
+
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({'success': True, 'results': results})
         return redirect('payments:pending-payments', case_id=case_id)
 
+    payments = Document.objects.filter(case=case, status='pending').select_related('category', 'user')
     context = {
         'case': case,
         'payments': payments,
@@ -724,14 +771,14 @@ def add_juge_avocat(request, case_id):
     existing_judge_ids = existing_judges.values_list('juge_id', flat=True)
     existing_lawyer_ids = existing_lawyers.values_list('avocat_id', flat=True)
 
-    # Exclure les utilisateurs déjà associés et l'utilisateur actuel
+    # Exclure les utilisateurs déjà associés et l'utilisateur actuel ; seul le nom est affiché dans les cases à cocher
     available_judges = User.objects.filter(role='judge').exclude(
         id__in=existing_judge_ids
-    ).exclude(id=request.user.id)
+    ).exclude(id=request.user.id).only('id', 'last_name').order_by('last_name')
 
     available_lawyers = User.objects.filter(role='lawyer').exclude(
         id__in=existing_lawyer_ids
-    ).exclude(id=request.user.id)
+    ).exclude(id=request.user.id).only('id', 'last_name').order_by('last_name')
 
     if request.method == 'POST':
         form = AddJugeAvocatForm(request.POST)
@@ -741,19 +788,8 @@ def add_juge_avocat(request, case_id):
             juges = form.cleaned_data.get('juges')
             avocats = form.cleaned_data.get('avocats')
 
-            # Ajouter les juges sélectionnés
-            for juge in juges:
-                JugeCase.objects.get_or_create(
-                    juge=juge,
-                    case=case
-                )
-
-            # Ajouter les avocats sélectionnés
-            for avocat in avocats:
-                AvocatCase.objects.get_or_create(
-                    avocat=avocat,
-                    case=case
-                )
+            # Un seul bulk_create par modèle de liaison
+            assign_magistrates([case.pk], [juge.pk for juge in juges], [avocat.pk for avocat in avocats])
 
             return redirect('payments:add-juge-avocat', case_id=case.id)
     else:
@@ -774,14 +810,14 @@ def add_juge_avocat(request, case_id):
 def remove_juge(request, case_id, juge_id):
     case = get_object_or_404(Case, id=case_id)
     juge = get_object_or_404(User, id=juge_id, role='judge')
-    JugeCase.objects.filter(case=case, juge=juge).delete()
+    unassign_from_cases(JugeCase, [juge.pk], [case.pk])
     return redirect('payments:add-juge-avocat', case_id=case.id)
 
 
 def remove_avocat(request, case_id, avocat_id):
     case = get_object_or_404(Case, id=case_id)
     avocat = get_object_or_404(User, id=avocat_id, role='lawyer')
-    AvocatCase.objects.filter(case=case, avocat=avocat).delete()
+    unassign_from_cases(AvocatCase, [avocat.pk], [case.pk])
     return redirect('payments:add-juge-avocat', case_id=case.id)
 
 
@@ -794,10 +830,19 @@ class DraftCaseListView(ListView):
     def get_queryset(self):
         user = self.request.user
         if user.role in ['administrator', 'lawyer']:
-            return Case.objects.filter(draft=True).order_by('parent_cases__parent__email')
+            cases = Case.objects.filter(draft=True).order_by('display_name')
+            query = self.request.GET.get('q', '').strip()
+            if query:
+                cases = cases.filter(search_name__contains=normalize_search(query))
+            return cases
         else:
             return Case.objects.none()
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '')
+        return context
+
 
     def dispatch(self, request, *args, **kwargs):
         if request.user.role not in ['administrator', 'lawyer']:
@@ -817,9 +862,14 @@ def convert_draft_case(request, case_id):
         if form.is_valid():
             case = form.save(commit=False)
             case.draft = False
-            case.save()
-            messages.success(request, "Draft case has been converted to a regular case.")
-            return redirect('payments:payment-history', case_id=case.id)
+            try:
+                with transaction.atomic():
+                    case.save()
+            except IntegrityError:
+                messages.error(request, "Un dossier avec ces deux parents existe déjà.")
+            else:
+                messages.success(request, "Draft case has been converted to a regular case.")
+                return redirect('payments:payment-history', case_id=case.id)
     else:
         form = ConvertDraftCaseForm(instance=case)
 
@@ -835,7 +885,7 @@ def update_percentages(request, case_id):
     parent2_percentage = float(request.POST.get('parent2_percentage', 0))
 
     # Mettez à jour les objets ParentCase associés
-    parent_cases = case.parent_cases.all().order_by('id')
+    parent_cases = case.ordered_parent_cases
     if len(parent_cases) > 0:
         parent_cases[0].percentage = parent1_percentage
         parent_cases[0].save()
@@ -854,7 +904,7 @@ def index_payments(request):
         return redirect('home')  # Redirect to an appropriate page if the user is not an administrator
 
     current_year = timezone.now().year
-    indexations = IndexHistory.objects.all()
+    indexations = get_index_history()
 
     if request.method == 'POST':
         form = IndexPaymentForm(request.POST)
@@ -863,7 +913,7 @@ def index_payments(request):
             confirm_indexation_list = request.POST.getlist('confirm_indexation')
             confirm_indexation = confirm_indexation_list[0] == 'true' if confirm_indexation_list else False
 
-            existing_index = IndexHistory.objects.filter(year=current_year).exists()
+            existing_index = has_index_for_year(current_year)
 
             if existing_index and not confirm_indexation:
                 return render(request, 'payments/index_payments.html', {
@@ -873,7 +923,7 @@ def index_payments(request):
                 })
             else:
                 # Récupère le dernier montant et indice de l'entrée la plus récente
-                last_index = IndexHistory.objects.order_by('-created_at').first()
+                last_index = get_current_index()
 
                 if last_index:
                     previous_indice = Decimal(last_index.indices)
@@ -891,7 +941,7 @@ def index_payments(request):
     else:
         form = IndexPaymentForm()
 
-    confirm_required = IndexHistory.objects.filter(year=current_year).exists()
+    confirm_required = has_index_for_year(current_year)
 
     return render(request, 'payments/index_payments.html', {
         'form': form,
@@ -900,23 +950,15 @@ def index_payments(request):
     })
 
 
+@require_POST
 @login_required
 def delete_indexation(request, index_id):
     if request.user.role != 'administrator':
         return redirect('home')  # Redirect to an appropriate page if the user is not an administrator
 
+    # Les montants des paiements ne dépendent pas de l'indexation : seule l'entrée est supprimée,
+    # et les signaux invalident la table des indexations en mémoire
     indexation = get_object_or_404(IndexHistory, id=index_id)
-    current_year = timezone.now().year
-    percentage = indexation.indices
-
-    if request.method == 'POST':
-        # Reverser l'indexation
-        multiplier = 1 / (1 + (percentage / 100))
-        Document.objects.all().update(amount=F('amount') * multiplier)
-
-        # Supprimer l'indexation
-        indexation.delete()
-        messages.success(request, f"Indexation for the year {indexation.year} has been deleted.")
-        return redirect('payments:index_payments')
-
-    return render(request, 'payments/delete_indexation_confirm.html', {'indexation': indexation})
+    indexation.delete()
+    messages.success(request, f"Indexation for the year {indexation.year} has been deleted.")
+    return redirect('payments:index_payments')